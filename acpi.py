@@ -0,0 +1,283 @@
+import os
+import sys
+import time
+import logging
+import threading
+from acpi_helper import CALL, BATCH, OK, read_frame, write_frame, pack_frames, unpack_frames
+
+log = logging.getLogger("dgsc.acpi")
+
+HELPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "acpi_helper.py")
+
+INTEL_WMAX = "\\_SB.AMWW.WMAX"
+AMD_WMAX = "\\_SB.AMW3.WMAX"
+
+ACPI_CALL_DICT = {
+    "get_laptop_model" : ["0x1a", "0x02", "0x02"],
+    "get_power_mode" : ["0x14", "0x0b", "0x00"],
+    "set_power_mode" : ["0x15", "0x01"],    #To be used with a parameter
+    "toggle_G_mode" : ["0x25", "0x01"],
+    "get_G_mode" : ["0x25", "0x02"],
+    "set_fan1_boost" : ["0x15", "0x02", "0x32"],            #To be used with a parameter
+    "get_fan1_boost" : ["0x14", "0x0c", "0x32"],
+    "get_fan1_rpm" : ["0x14", "0x05", "0x32"],
+    "get_cpu_temp" : ["0x14", "0x04", "0x01"],
+    "set_fan2_boost" : ["0x15", "0x02", "0x33"],            #To be used with a parameter
+    "get_fan2_boost" : ["0x14", "0x0c", "0x33"],
+    "get_fan2_rpm" : ["0x14", "0x05", "0x33"],
+    "get_gpu_temp" : ["0x14", "0x04", "0x06"]
+}
+
+# Seconds a get_* reply is reused for. The model never changes; power mode,
+# G mode and fan boost can also be changed by the firmware (G key, thermal
+# tables), so they are only trusted briefly. Sensors are read at most once
+# per telemetry tick.
+CACHE_TTL = {
+    "get_laptop_model" : float("inf"),
+    "get_power_mode" : 5.0,
+    "get_G_mode" : 5.0,
+    "get_fan1_boost" : 5.0,
+    "get_fan2_boost" : 5.0,
+    "get_fan1_rpm" : 0.5,
+    "get_fan2_rpm" : 0.5,
+    "get_cpu_temp" : 0.5,
+    "get_gpu_temp" : 0.5,
+}
+
+# Cached replies each write makes stale
+INVALIDATES = {
+    "set_power_mode" : ["get_power_mode", "get_G_mode"],   # The firmware can change G mode with it
+    "toggle_G_mode" : ["get_G_mode"],
+    "set_fan1_boost" : ["get_fan1_boost"],
+    "set_fan2_boost" : ["get_fan2_boost"],
+}
+
+
+class AcpiError(Exception):
+    pass
+
+
+class AcpiHelper:
+    """Connection to the privileged acpi_helper process.
+
+    The helper is started once (through pkexec unless elevate is False) and
+    keeps /proc/acpi/call open, so a call is one write and one read on a pipe.
+    """
+
+    def __init__(self, call_file=None, elevate=True, helper=HELPER):
+        self.call_file = call_file
+        self.elevate = elevate
+        self.helper = helper
+        self.process = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the helper. Returns False if it could not get ACPI access."""
+        import subprocess   # Only needed here; keeps the CLI quick to import
+        args = [sys.executable, self.helper]
+        if self.call_file:
+            args += ["--call-file", self.call_file]
+        if self.elevate:
+            args = ["pkexec"] + args
+        try:
+            self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        except OSError as err:
+            log.warning("Cannot start ACPI helper: %s", err)
+            return False
+        frame = read_frame(self.process.stdout)
+        if frame is None or frame[0] != OK:
+            log.warning("ACPI helper not available: %s", frame[1].decode() if frame else "exited")
+            self.close()
+            return False
+        return True
+
+    def _exchange(self, opcode, payload):
+        with self._lock:
+            if self.process is None:
+                raise AcpiError("ACPI helper is not running")
+            try:
+                write_frame(self.process.stdin, opcode, payload)
+                frame = read_frame(self.process.stdout)
+            except OSError as err:
+                raise AcpiError("ACPI helper connection lost: {}".format(err))
+        if frame is None:
+            raise AcpiError("ACPI helper exited")
+        status, payload = frame
+        if status != OK:
+            raise AcpiError(payload.decode())
+        return payload
+
+    def execute(self, request):
+        """Run one acpi_call method string and return its reply text."""
+        return self._exchange(CALL, request.encode()).decode()
+
+    def execute_batch(self, requests, strict=True):
+        """Run several method strings in one round trip and return their replies.
+
+        A failed call raises AcpiError, or gives None in its place if not strict.
+        """
+        payload = self._exchange(BATCH, pack_frames((CALL, request.encode()) for request in requests))
+        replies = []
+        for status, reply in unpack_frames(payload):
+            if status != OK:
+                if strict:
+                    raise AcpiError(reply.decode())
+                replies.append(None)
+            else:
+                replies.append(reply.decode())
+        return replies
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+
+
+class _Pending:
+    """A read in flight, which other callers of the same read wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.reply = None
+        self.error = None
+
+
+class Acpi:
+    """Formats the WMAX calls of acpi_call_dict and runs them through the helper.
+
+    Replies of the get_* calls in ttl are cached for their TTL, keyed by the
+    full method string, and dropped when a call in INVALIDATES runs. A read
+    that is already in flight on another thread is waited for instead of
+    being sent again. calls counts the ACPI calls actually made.
+    """
+
+    def __init__(self, helper, wmax=INTEL_WMAX, ttl=CACHE_TTL):
+        self.helper = helper
+        self.wmax = wmax
+        self.ttl = ttl
+        self.calls = 0
+        self._cache = {}
+        self._pending = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def format(self, cmd, arg1="0x00", arg2="0x00"):
+        args = ACPI_CALL_DICT[cmd]
+        if len(args)==4:
+            params = args
+        elif len(args)==3:
+            params = args + [arg1]
+        elif len(args)==2:
+            params = args + [arg1, arg2]
+        else:
+            raise AcpiError("Malformed ACPI call {}".format(cmd))
+        return "{} 0 {} {{{}, {}, {}, 0x00}}".format(self.wmax, *params)
+
+    def call(self, cmd, arg1="0x00", arg2="0x00"):
+        request = self.format(cmd, arg1, arg2)
+        if cmd in self.ttl:
+            return self._read([(cmd, request)], self._execute_one)[request]
+        with self._lock:
+            self.calls += 1
+        try:
+            reply = self.helper.execute(request)
+            log.debug("%s -> %s", request, reply)
+            return reply
+        finally:
+            if cmd in INVALIDATES:
+                self.invalidate(*INVALIDATES[cmd])
+
+    def call_batch(self, cmds):
+        """Run the given parameterless calls in one round trip.
+
+        Returns a dict mapping each call name to its reply parsed as an int.
+        Cached replies are not sent again.
+        """
+        requests = [(cmd, self.format(cmd)) for cmd in cmds]
+        replies = self._read(requests, self._execute_batch)
+        try:
+            return {cmd: int(replies[request], 0) for cmd, request in requests}
+        except ValueError as err:
+            raise AcpiError("Unexpected ACPI reply: {}".format(err))
+
+    def call_many(self, calls):
+        """Run [(cmd, arg1, ...), ...] in order in one round trip and return the reply texts.
+
+        Meant for writes; the cached replies they make stale are dropped.
+        """
+        requests = [self.format(*call) for call in calls]
+        with self._lock:
+            self.calls += len(requests)
+        try:
+            replies = self.helper.execute_batch(requests)
+            log.debug("%s -> %s", requests, replies)
+            return replies
+        finally:
+            for call in calls:
+                if call[0] in INVALIDATES:
+                    self.invalidate(*INVALIDATES[call[0]])
+
+    def invalidate(self, *cmds):
+        """Forget the cached replies of cmds, or of every call if none are given."""
+        with self._lock:
+            self._generation += 1
+            if not cmds:
+                self._cache.clear()
+                return
+            for cmd in cmds:
+                self._cache.pop(self.format(cmd), None)
+
+    def _execute_one(self, requests):
+        return [self.helper.execute(requests[0])]
+
+    def _execute_batch(self, requests):
+        return self.helper.execute_batch(requests)
+
+    def _read(self, requests, execute):
+        """Return {request: reply}, calling execute(list) only for what is neither cached nor in flight."""
+        replies = {}
+        waiting = []
+        mine = []
+        with self._lock:
+            now = time.monotonic()
+            generation = self._generation
+            for cmd, request in requests:
+                cached = self._cache.get(request)
+                if cached is not None and now - cached[1] < self.ttl.get(cmd, 0):
+                    replies[request] = cached[0]
+                elif request in self._pending:
+                    waiting.append((request, self._pending[request]))
+                else:
+                    pending = self._pending[request] = _Pending()
+                    mine.append((cmd, request, pending))
+            self.calls += len(mine)
+        if mine:
+            try:
+                results = execute([request for cmd, request, pending in mine])
+            except BaseException as err:
+                log.debug("%s failed: %s", requests, err)
+                with self._lock:
+                    for cmd, request, pending in mine:
+                        del self._pending[request]
+                        pending.error = err
+                        pending.done.set()
+                raise
+            log.debug("%s -> %s", [cmd for cmd, request, pending in mine], results)
+            now = time.monotonic()
+            with self._lock:
+                for (cmd, request, pending), reply in zip(mine, results):
+                    del self._pending[request]
+                    # A write that ran meanwhile may have made this reply stale
+                    if generation == self._generation:
+                        self._cache[request] = (reply, now)
+                    pending.reply = reply
+                    pending.done.set()
+                    replies[request] = reply
+        for request, pending in waiting:
+            pending.done.wait()
+            if pending.error is not None:
+                raise AcpiError(str(pending.error))
+            replies[request] = pending.reply
+        return replies
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+"""Privileged ACPI call helper.
+
+Started once through pkexec, it keeps /proc/acpi/call open and answers
+requests framed on stdin/stdout:
+
+    request:  opcode (1 byte), length (2 bytes, big endian), payload
+    response: status (1 byte), length (2 bytes, big endian), payload
+
+A CALL request carries the acpi_call method string and the response the
+text the kernel returned for it. A BATCH request carries several CALL
+frames back to back; its OK response carries one response frame per call,
+in order, so a whole set of reads costs a single round trip. Once the call file is open the helper
+sends one OK frame, or an ERROR frame with the reason before exiting. It
+exits when its stdin is closed.
+
+The call file is opened with O_APPEND, so a regular file holding a
+NUL-terminated reply can stand in for /proc/acpi/call: requests are
+appended after the reply and every read returns it.
+"""
+import os
+import sys
+import struct
+import argparse
+
+HEADER = struct.Struct('>BH')
+
+# Request opcodes
+CALL = 0x01
+BATCH = 0x02
+
+# Response status
+OK = 0x00
+ERROR = 0x01
+
+DEFAULT_CALL_FILE = "/proc/acpi/call"
+MAX_REPLY = 4096
+ALLOWED_METHODS = (b"\\_SB.AMWW.WMAX ", b"\\_SB.AMW3.WMAX ")
+
+
+def read_exact(stream, length):
+    data = b""
+    while len(data) < length:
+        chunk = stream.read(length - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def read_frame(stream):
+    """Return (code, payload), or None at end of stream."""
+    header = read_exact(stream, HEADER.size)
+    if header is None:
+        return None
+    code, length = HEADER.unpack(header)
+    payload = read_exact(stream, length)
+    if payload is None:
+        return None
+    return code, payload
+
+
+def write_frame(stream, code, payload):
+    stream.write(HEADER.pack(code, len(payload)) + payload)
+    stream.flush()
+
+
+def pack_frames(frames):
+    return b"".join(HEADER.pack(code, len(payload)) + payload for code, payload in frames)
+
+
+def unpack_frames(data):
+    frames = []
+    offset = 0
+    while offset < len(data):
+        code, length = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+        frames.append((code, data[offset:offset + length]))
+        offset += length
+    return frames
+
+
+def call(fd, request):
+    os.write(fd, request)
+    reply = os.pread(fd, MAX_REPLY, 0)
+    return reply.split(b"\x00", 1)[0].strip()
+
+
+def handle(fd, request):
+    if not request.startswith(ALLOWED_METHODS):
+        return ERROR, b"method not allowed"
+    try:
+        return OK, call(fd, request)
+    except OSError as err:
+        return ERROR, str(err).encode()
+
+
+def serve(call_file, rfile, wfile):
+    try:
+        fd = os.open(call_file, os.O_RDWR | os.O_APPEND)
+    except OSError as err:
+        write_frame(wfile, ERROR, str(err).encode())
+        return 1
+    write_frame(wfile, OK, b"")
+    try:
+        while True:
+            frame = read_frame(rfile)
+            if frame is None:
+                return 0
+            opcode, payload = frame
+            if opcode == CALL:
+                write_frame(wfile, *handle(fd, payload))
+            elif opcode == BATCH:
+                try:
+                    requests = unpack_frames(payload)
+                except struct.error:
+                    write_frame(wfile, ERROR, b"malformed batch")
+                    continue
+                write_frame(wfile, OK, pack_frames(handle(fd, request) for code, request in requests))
+            else:
+                write_frame(wfile, ERROR, b"unknown opcode")
+    finally:
+        os.close(fd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--call-file", default=DEFAULT_CALL_FILE)
+    args = parser.parse_args()
+    return serve(args.call_file, sys.stdin.buffer, sys.stdout.buffer)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
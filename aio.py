@@ -0,0 +1,157 @@
+"""asyncio front end for the lighting controller and the ACPI calls.
+
+The device I/O stays blocking; each device gets one executor thread (a
+"lane"), so calls to the same device keep their order while the USB and
+ACPI lanes run side by side:
+
+    devices = Devices()
+    lights = AsyncLights(devices)
+    acpi = AsyncAcpi(devices, Acpi(helper, wmax))
+    await asyncio.gather(lights.set_static(255, 0, 0), acpi.call_batch(SENSORS))
+
+Every call takes a timeout (the lane's default if not given). A call that
+is cancelled before its lane picks it up never runs; one that is already
+running cannot be interrupted and finishes in the background. After a USB
+call times out the session is closed behind it, so the next call starts on
+a fresh handle.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger("dgsc.usb")
+
+TIMEOUTS = {
+    "usb": 5.0,
+    "acpi": 2.0,
+    "hwmon": 1.0,
+}
+
+
+class Devices:
+    """The lanes the async calls run on.
+
+    executor(lane) returns the executor of a lane; pass Worker.executor to
+    share the GUI's lanes so async and callback based calls stay ordered.
+    """
+
+    def __init__(self, executor=None, timeouts=TIMEOUTS):
+        self._lanes = {}
+        self.executor = executor or self._executor
+        self.timeouts = timeouts
+
+    def _executor(self, lane):
+        if lane not in self._lanes:
+            self._lanes[lane] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=lane)
+        return self._lanes[lane]
+
+    async def run(self, lane, fn, *args, timeout=None, **kwargs):
+        """Run fn(*args, **kwargs) on lane and return its result."""
+        if timeout is None:
+            timeout = self.timeouts.get(lane)
+        future = asyncio.wrap_future(self.executor(lane).submit(functools.partial(fn, *args, **kwargs)))
+        return await asyncio.wait_for(future, timeout)
+
+    def shutdown(self):
+        for executor in self._lanes.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+        self._lanes.clear()
+
+
+class AsyncElc:
+    """Async versions of the Elc commands, run on the usb lane.
+
+    Any Elc method is available as a coroutine with an extra timeout
+    keyword, e.g. await elc.set_color([0, 1], 255, 0, 0). transaction()
+    sends several commands in one Elc transaction.
+    """
+
+    def __init__(self, devices, session=None):
+        self.devices = devices
+        self.session = session
+
+    def _session(self):
+        if self.session is None:
+            import awelc
+            self.session = awelc.get_session()
+        return self.session
+
+    async def _usb(self, fn, *args, timeout=None, **kwargs):
+        session = self._session()
+        try:
+            return await self.devices.run("usb", fn, *args, timeout=timeout, **kwargs)
+        except asyncio.TimeoutError:
+            log.warning("USB call timed out, reopening the device")
+            self.devices.executor("usb").submit(session.close)
+            raise
+
+    async def run(self, fn, *args, timeout=None):
+        """Run fn(elc, *args) through the session."""
+        return await self._usb(self._session().run, fn, *args, timeout=timeout)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        from elc import Elc
+        method = getattr(Elc, name)
+
+        async def command(*args, timeout=None):
+            return await self.run(method, *args, timeout=timeout)
+        command.__name__ = name
+        return command
+
+    async def transaction(self, commands, timeout=None):
+        """Run [(name, args), ...] as one transaction; returns None for each command."""
+        def run(elc):
+            with elc.transaction():
+                for name, args in commands:
+                    getattr(elc, name)(*args)
+        return await self.run(run, timeout=timeout)
+
+
+class AsyncLights(AsyncElc):
+    """The awelc profile operations as coroutines."""
+
+    async def _operation(self, name, *args, timeout=None, **kwargs):
+        import awelc
+        return await self._usb(getattr(awelc, name), *args, session=self._session(), timeout=timeout, **kwargs)
+
+    async def set_static(self, red, green, blue, verify=False, force=False, timeout=None):
+        return await self._operation("set_static", red, green, blue, verify=verify, force=force, timeout=timeout)
+
+    async def set_morph(self, red, green, blue, duration, verify=False, force=False, timeout=None):
+        return await self._operation("set_morph", red, green, blue, duration, verify=verify, force=force,
+                                     timeout=timeout)
+
+    async def set_color_and_morph(self, red, green, blue, red_morph, green_morph, blue_morph, duration,
+                                  verify=False, force=False, timeout=None):
+        return await self._operation("set_color_and_morph", red, green, blue, red_morph, green_morph, blue_morph,
+                                     duration, verify=verify, force=force, timeout=timeout)
+
+    async def remove_animation(self, timeout=None):
+        return await self._operation("remove_animation", timeout=timeout)
+
+    async def set_dim(self, level, timeout=None):
+        return await self._operation("set_dim", level, timeout=timeout)
+
+    async def set_colors(self, colors, timeout=None):
+        return await self._operation("set_colors", colors, timeout=timeout)
+
+
+class AsyncAcpi:
+    """Acpi.call and Acpi.call_batch as coroutines on the acpi lane."""
+
+    def __init__(self, devices, acpi):
+        self.devices = devices
+        self.acpi = acpi
+
+    async def call(self, cmd, arg1="0x00", arg2="0x00", timeout=None):
+        return await self.devices.run("acpi", self.acpi.call, cmd, arg1, arg2, timeout=timeout)
+
+    async def call_batch(self, cmds, timeout=None):
+        return await self.devices.run("acpi", self.acpi.call_batch, cmds, timeout=timeout)
+
+    async def run(self, fn, *args, timeout=None):
+        """Run fn(acpi, *args), e.g. power.apply_power_mode, on the acpi lane."""
+        return await self.devices.run("acpi", fn, self.acpi, *args, timeout=timeout)
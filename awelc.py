@@ -1,10 +1,19 @@
 #!/usr/bin/python3
 import sys
-import argparse
-import random
+import os
+import json
+import errno
+import hashlib
+import logging
+import functools
 from elc import *
 from elc_constants import *
+from paths import cache_file
+import profiles
+import usb.core
+import usb.util
 
+log = logging.getLogger("dgsc.usb")
 
 DURATION_MAX = 0xffff
 DURATION_BATTERY_LOW = 0xff
@@ -15,29 +24,227 @@ ZONES = [0, 1, 2, 3]
 ZONES_KB = [0, 1, 2]
 ZONES_NP = [3]
 
-def init_device():
-    supportedProducts = [0x0550, 0x0551]
-    vid = 0x187C
+SUPPORTED_PRODUCTS = [0x0550, 0x0551]
+VID = 0x187C
 
+# USBError errnos of a device that is gone, e.g. unplugged or reset away
+DEVICE_LOST = (errno.ENODEV, errno.ENXIO)
+
+
+def find_device():
     # Find supported device
-    device = None
-    for pid in supportedProducts:
-        device = usb.core.find(idVendor=vid, idProduct=pid)
+    for pid in SUPPORTED_PRODUCTS:
+        device = usb.core.find(idVendor=VID, idProduct=pid)
         if device:
-            break
+            return device
+    raise Exception('No supported device was found. Do you have an RGB keyboard 187c:0550 or 187c:0551?')
+
+
+class ElcSession:
+    """Keeps the LED controller claimed between operations.
+
+    The bus is searched and the device reset only when the session is opened,
+    so an apply or a tray toggle only costs its HID reports. If a transfer
+    fails because the device went away (suspend, replug), the handle is
+    dropped and the operation is retried once on a fresh one.
+    """
+
+    def __init__(self, device=None):
+        self._given_device = device
+        self._detached = None
+        self.device = None
+        self.elc = None
+
+    def open(self):
+        if self.elc is not None:
+            return self.elc
+        if self._given_device is not None:
+            device = self._given_device
+        else:
+            device = find_device()
+            i = device[0].interfaces()[0].bInterfaceNumber
+            device.reset()
+            if device.is_kernel_driver_active(i):
+                device.detach_kernel_driver(i)
+                self._detached = i
+        self.device = device
+        self.elc = Elc(VID, device.idProduct, debug=0, device=device)
+        return self.elc
+
+    def close(self):
+        try:
+            if self.device is not None and self._given_device is None:
+                usb.util.dispose_resources(self.device)
+                if self._detached is not None:
+                    try:
+                        self.device.attach_kernel_driver(self._detached)
+                    except usb.core.USBError:
+                        pass
+        finally:
+            self._detached = None
+            self.device = None
+            self.elc = None
+
+    def run(self, operation, *args):
+        """Run operation(elc, *args), reconnecting once if the device was lost.
+
+        Other USB errors, such as timeouts, are raised as they are: the
+        device is still there and the operation may be half done.
+        """
+        try:
+            return operation(self.open(), *args)
+        except usb.core.USBError as err:
+            if err.errno not in DEVICE_LOST:
+                raise
+        log.info("Lighting controller lost, reconnecting")
+        try:
+            self.close()
+        except usb.core.USBError:
+            pass    # Its resources went with it
+        return operation(self.open(), *args)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_session = ElcSession()
+
+
+def get_session():
+    return _session
+
+
+def close():
+    _session.close()
+
+
+def _transaction(elc, func, args, kwargs):
+    with elc.transaction():
+        return func(elc, *args, **kwargs)
+
+
+def _session_operation(func):
+    # Public operations take an optional session=, defaulting to the shared one,
+    # and send their reports as a single transaction.
+    @functools.wraps(func)
+    def wrapper(*args, session=None, **kwargs):
+        return (session or _session).run(_transaction, func, args, kwargs)
+    return wrapper
+
+
+class AnimationCache:
+    """Content hashes of the animations last written to each controller.
+
+    Stored on disk so that unchanged power animations are not rewritten on
+    the next apply, even after a restart. Without a usable file the hashes
+    live in memory only.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._hashes = None
+
+    def _load(self):
+        if self._hashes is None:
+            try:
+                self.path = self.path or cache_file("animations.json")
+                with open(self.path) as f:
+                    self._hashes = json.load(f)
+            except (OSError, ValueError):
+                self._hashes = {}
+        return self._hashes
+
+    def _save(self):
+        if self.path is None:
+            return
+        # Runs after the device was programmed, so a failure must not raise
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._hashes, f)
+            os.replace(tmp, self.path)
+        except OSError as err:
+            log.warning("Cannot save the animation cache: %s", err)
 
-    if not device:
-        raise Exception('No supported device was found. Do you have an RGB keyboard 187c:0550 or 187c:0551?')
+    def get(self, key):
+        return self._load().get(key)
 
-    ep = device[0].interfaces()[0].endpoints()[0]
-    i = device[0].interfaces()[0].bInterfaceNumber
-    device.reset()
-    if device.is_kernel_driver_active(i):
-        device.detach_kernel_driver(i)
+    def update(self, hashes):
+        self._load().update(hashes)
+        self._save()
+
+    def clear(self, product):
+        hashes = self._load()
+        for key in [k for k in hashes if k.startswith(product + ":")]:
+            del hashes[key]
+        self._save()
+
+
+_animation_cache = AnimationCache()
+
+
+def _product(elc):
+    return "{:04x}".format(getattr(elc.device, "idProduct", 0))
+
+
+def _default_report(reports):
+    """The trailing set-default report of an animation, if it has one."""
+    last = reports[-1]
+    report_id, command, subcommand, animation = ANIMATION_REPORT.unpack_from(last)
+    if command in (USER_ANIMATION, POWER_ANIMATION) and subcommand == SET_DEFAULT:
+        return last
+    return None
+
+
+class AnimationWriter:
+    """Writes animations, skipping those identical to what was last written.
+
+    Each animation's raw reports are hashed. With verify, an animation is
+    only skipped if the firmware still has it. The new hashes are stored
+    once the transaction has been acknowledged.
+
+    Every animation ends by making itself the default, so when the last one
+    is skipped after others were rewritten, its set-default report is sent
+    again by finish() to leave the same default as a full write.
+    """
+
+    def __init__(self, elc, verify=False, force=False, cache=None):
+        self.elc = elc
+        self.verify = verify
+        self.force = force
+        self.cache = cache or _animation_cache
+        self.written = {}
+        self._default = None
+        elc.on_commit(self._store)
+
+    def write(self, animation, reports):
+        digest = hashlib.sha1(b"".join(reports)).hexdigest()
+        key = "{}:{:04x}".format(_product(self.elc), animation)
+        if not self.force and self.cache.get(key) == digest:
+            if not self.verify or self.elc.get_animation_by_id(animation)[0] == animation:
+                log.debug("Animation %#06x unchanged, skipped", animation)
+                self._default = _default_report(reports)
+                return False
+        log.debug("Writing animation %#06x, %d reports", animation, len(reports))
+        for report in reports:
+            self.elc.send_report(report)
+        self.written[key] = digest
+        self._default = None
+        return True
+
+    def finish(self):
+        if self._default is not None and self.written:
+            self.elc.send_report(self._default)
+        self._default = None
+
+    def _store(self):
+        if self.written:
+            self.cache.update(self.written)
 
-    # Create the elc object
-    elc = Elc(vid, device.idProduct, debug=0)
-    return (elc, device)
 
 def apply_action(elc, red, green, blue, duration, tempo, animation=AC_CHARGING, effect=COLOR, zones=ZONES):
     if (effect == COLOR):
@@ -85,70 +292,100 @@ def battery_flashing(elc):
     elc.finish_save_animation(DC_LOW)
     elc.set_default_animation(DC_LOW)
 
-def set_static(red, green, blue):
-    set_dim(0)
-    elc, device = init_device()
-    apply_action(elc, 0, 0, 0, DURATION_MAX, TEMPO_MIN,
-                 AC_SLEEP, COLOR)       # Off on AC Sleep
-    apply_action(elc, red, green, blue, DURATION_MAX, TEMPO_MIN,
-                 AC_CHARGED, COLOR)     # Full brightness on AC, charged
-    apply_action(elc, red, green, blue, DURATION_MAX, TEMPO_MIN,
-                 AC_CHARGING, COLOR)    # Full brightness on AC, charging
-    apply_action(elc, 0, 0, 0, DURATION_MAX, TEMPO_MIN,
-                 DC_SLEEP, COLOR)       # Off on DC Sleep
-    apply_action(elc, int(red/2), int(green/2), int(blue/2), DURATION_MAX, TEMPO_MIN,
-                 DC_ON, COLOR)          # Half brightness on Battery
-    battery_flashing(elc)  # Red flashing on battery low.
-    # apply_action(elc, 0, 0, 0, 0, 0,
-    #              DEFAULT_POST_BOOT, COLOR)       # Off on post-boot
-    # apply_action(elc, 0, 0, 0, 0, 0,
-    #              RUNNING_START, COLOR)           # Off on start
-    # apply_action(elc, 0, 0, 0, 0, 0,
-    #              RUNNING_FINISH, COLOR)          # Off on finish
-    device.reset()
-
-def set_morph(red, green, blue, duration):
-    set_dim(0)
-    elc, device = init_device()
-    apply_action(elc, 0, 0, 0, DURATION_MAX, TEMPO_MIN,
-                 AC_SLEEP, COLOR)       # Off on AC Sleep
-    apply_action(elc, red, green, blue, duration, TEMPO_MIN,
-                 AC_CHARGED, MORPH)     # Full brightness on AC, charged
-    apply_action(elc, red, green, blue, duration, TEMPO_MIN,
-                 AC_CHARGING, MORPH)    # Full brightness on AC, charging
-    apply_action(elc, 0, 0, 0, DURATION_MAX, TEMPO_MIN,
-                 DC_SLEEP, COLOR)       # Off on DC Sleep
-    apply_action(elc, int(red/2), int(green/2), int(blue/2), duration, TEMPO_MIN,
-                 DC_ON, MORPH)          # Half brightness on Battery
-    battery_flashing(elc)  # Red flashing on battery low.
-    # apply_action(elc, 0, 0, 0, 0, 0,
-    #              DEFAULT_POST_BOOT, COLOR)       # Off on post-boot
-    # apply_action(elc, 0, 0, 0, 0, 0,
-    #              RUNNING_START, COLOR)           # Off on start
-    # apply_action(elc, 0, 0, 0, 0, 0,
-    #              RUNNING_FINISH, COLOR)          # Off on finish
-    device.reset()
-
-def set_color_and_morph(red, green, blue,red_morph, green_morph, blue_morph, duration):
-    set_dim(0)
-    elc, device = init_device()
+def static_animations(red, green, blue):
+    return [
+        (AC_SLEEP, apply_action, (0, 0, 0, DURATION_MAX, TEMPO_MIN,
+                                  AC_SLEEP, COLOR)),        # Off on AC Sleep
+        (AC_CHARGED, apply_action, (red, green, blue, DURATION_MAX, TEMPO_MIN,
+                                    AC_CHARGED, COLOR)),    # Full brightness on AC, charged
+        (AC_CHARGING, apply_action, (red, green, blue, DURATION_MAX, TEMPO_MIN,
+                                     AC_CHARGING, COLOR)),  # Full brightness on AC, charging
+        (DC_SLEEP, apply_action, (0, 0, 0, DURATION_MAX, TEMPO_MIN,
+                                  DC_SLEEP, COLOR)),        # Off on DC Sleep
+        (DC_ON, apply_action, (int(red/2), int(green/2), int(blue/2), DURATION_MAX, TEMPO_MIN,
+                               DC_ON, COLOR)),              # Half brightness on Battery
+        (DC_LOW, battery_flashing, ()),  # Red flashing on battery low.
+        # (DEFAULT_POST_BOOT, apply_action, (0, 0, 0, 0, 0,
+        #                                    DEFAULT_POST_BOOT, COLOR)),  # Off on post-boot
+        # (RUNNING_START, apply_action, (0, 0, 0, 0, 0,
+        #                                RUNNING_START, COLOR)),          # Off on start
+        # (RUNNING_FINISH, apply_action, (0, 0, 0, 0, 0,
+        #                                 RUNNING_FINISH, COLOR)),        # Off on finish
+    ]
+
+def morph_animations(red, green, blue, duration):
+    return [
+        (AC_SLEEP, apply_action, (0, 0, 0, DURATION_MAX, TEMPO_MIN,
+                                  AC_SLEEP, COLOR)),        # Off on AC Sleep
+        (AC_CHARGED, apply_action, (red, green, blue, duration, TEMPO_MIN,
+                                    AC_CHARGED, MORPH)),    # Full brightness on AC, charged
+        (AC_CHARGING, apply_action, (red, green, blue, duration, TEMPO_MIN,
+                                     AC_CHARGING, MORPH)),  # Full brightness on AC, charging
+        (DC_SLEEP, apply_action, (0, 0, 0, DURATION_MAX, TEMPO_MIN,
+                                  DC_SLEEP, COLOR)),        # Off on DC Sleep
+        (DC_ON, apply_action, (int(red/2), int(green/2), int(blue/2), duration, TEMPO_MIN,
+                               DC_ON, MORPH)),              # Half brightness on Battery
+        (DC_LOW, battery_flashing, ()),  # Red flashing on battery low.
+    ]
+
+def color_and_morph_animations(red, green, blue, red_morph, green_morph, blue_morph, duration):
     #Set static color on keyboard, and morph on numpad
-    apply_action_color_and_morph(elc, 0, 0, 0, 0, 0, 0, DURATION_MAX, TEMPO_MIN,
-                 AC_SLEEP)       # Off on AC Sleep
-    apply_action_color_and_morph(elc, red, green, blue, red_morph, green_morph, blue_morph, duration, TEMPO_MIN,
-                 AC_CHARGED)     # Full brightness on AC, charged
-    apply_action_color_and_morph(elc, red, green, blue, red_morph, green_morph, blue_morph, duration, TEMPO_MIN,
-                 AC_CHARGING)    # Full brightness on AC, charging
-    apply_action_color_and_morph(elc,0, 0, 0, 0, 0, 0, DURATION_MAX, TEMPO_MIN,
-                 DC_SLEEP)       # Off on DC Sleep
-    apply_action_color_and_morph(elc, int(red/2), int(green/2), int(blue/2), int(red_morph/2), int(green_morph/2), int(blue_morph/2), duration, TEMPO_MIN,
-                 DC_ON)          # Half brightness on Battery
-    battery_flashing(elc)  # Red flashing on battery low.
-    device.reset()
-
-def remove_animation():
-    set_dim(100)
-    elc, device = init_device()
+    return [
+        (AC_SLEEP, apply_action_color_and_morph, (0, 0, 0, 0, 0, 0, DURATION_MAX, TEMPO_MIN,
+                                                  AC_SLEEP)),       # Off on AC Sleep
+        (AC_CHARGED, apply_action_color_and_morph, (red, green, blue, red_morph, green_morph, blue_morph, duration, TEMPO_MIN,
+                                                    AC_CHARGED)),   # Full brightness on AC, charged
+        (AC_CHARGING, apply_action_color_and_morph, (red, green, blue, red_morph, green_morph, blue_morph, duration, TEMPO_MIN,
+                                                     AC_CHARGING)), # Full brightness on AC, charging
+        (DC_SLEEP, apply_action_color_and_morph, (0, 0, 0, 0, 0, 0, DURATION_MAX, TEMPO_MIN,
+                                                  DC_SLEEP)),       # Off on DC Sleep
+        (DC_ON, apply_action_color_and_morph, (int(red/2), int(green/2), int(blue/2), int(red_morph/2), int(green_morph/2), int(blue_morph/2), duration, TEMPO_MIN,
+                                               DC_ON)),             # Half brightness on Battery
+        (DC_LOW, battery_flashing, ()),  # Red flashing on battery low.
+    ]
+
+
+_profile_cache = profiles.ProfileCache()
+
+
+def compiled_profile(kind, animations, *args):
+    """Return the compiled reports of animations(*args), from the cache if possible."""
+    key = profiles.profile_key(kind, args)
+    segments = _profile_cache.load(key)
+    if segments is None:
+        segments = profiles.compile_animations(animations(*args))
+        _profile_cache.store(key, segments)
+    return segments
+
+@_session_operation
+def replay_profile(elc, segments, verify=False, force=False):
+    elc.dim(ZONES, 0)
+    # After set_color (previews, effects) the stored animations are no longer
+    # shown, so skipping the unchanged ones would leave the direct colors up
+    writer = AnimationWriter(elc, verify, force or elc.direct_colors)
+    for animation, reports in segments:
+        writer.write(animation, reports)
+    writer.finish()
+    elc.on_commit(lambda: setattr(elc, "direct_colors", False))
+
+def set_static(red, green, blue, verify=False, force=False, session=None):
+    replay_profile(compiled_profile("static", static_animations, red, green, blue),
+                   verify=verify, force=force, session=session)
+
+def set_morph(red, green, blue, duration, verify=False, force=False, session=None):
+    replay_profile(compiled_profile("morph", morph_animations, red, green, blue, duration),
+                   verify=verify, force=force, session=session)
+
+def set_color_and_morph(red, green, blue,red_morph, green_morph, blue_morph, duration, verify=False, force=False, session=None):
+    replay_profile(compiled_profile("color_and_morph", color_and_morph_animations, red, green, blue,
+                                    red_morph, green_morph, blue_morph, duration),
+                   verify=verify, force=force, session=session)
+
+@_session_operation
+def remove_animation(elc):
+    elc.dim(ZONES, 100)
+    product = _product(elc)
+    elc.on_commit(lambda: _animation_cache.clear(product))
     elc.remove_animation(AC_SLEEP)
     elc.remove_animation(AC_CHARGED)
     elc.remove_animation(AC_CHARGING)
@@ -160,12 +397,16 @@ def remove_animation():
     # elc.remove_animation(RUNNING_FINISH)
     animations = elc.get_animation_count()
     while animations != (0,0):
-        print("Removing unknown animation {}".format(animations[1]))
+        log.info("Removing unknown animation %#06x", animations[1])
         elc.remove_animation(animations[1])
         animations = elc.get_animation_count()
-    device.reset()
 
-def set_dim(level):
-    elc, device = init_device()
+@_session_operation
+def set_dim(elc, level):
     elc.dim(ZONES,level)
-    device.reset()
+
+@_session_operation
+def set_colors(elc, colors):
+    """Show [(zones, (red, green, blue)), ...] directly, without touching the stored animations."""
+    for zones, (red, green, blue) in colors:
+        elc.set_color(zones, red, green, blue)
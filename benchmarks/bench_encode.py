@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+"""Micro-benchmark of ELC report encoding, hex strings vs struct packing.
+
+Run from the repository root: python benchmarks/bench_encode.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from elc import Elc, Action
+from elc_constants import *
+
+ZONES = [0, 1, 2, 3]
+ACTIONS = (Action(MORPH, 0x100, 1, 255, 0, 0), Action(MORPH, 0x100, 1, 0, 255, 0),
+           Action(MORPH, 0x100, 1, 0, 0, 255))
+
+
+class NullDevice:
+    idProduct = 0x0550
+
+
+# The encoding used before the binary encoder, kept here for comparison.
+def legacy(elc, fragment):
+    report = bytearray.fromhex('03' + fragment)
+    report += bytearray.fromhex('00' * (33 - len(report)))
+    return report
+
+
+def legacy_action(action):
+    return (format(action.effect, '02x') + format(action.duration, '04x') + format(action.tempo, '04x') +
+            format(action.red, '02x') + format(action.green, '02x') + format(action.blue, '02x'))
+
+
+def legacy_animation(elc, subcommand, animation):
+    command = format(POWER_ANIMATION, '02x')
+    return legacy(elc, command + format(subcommand, '04x') + format(animation, '04x'))
+
+
+def legacy_series(elc, zones, loop=1):
+    zonestring = "".join(format(x, "02x") for x in zones)
+    return legacy(elc, format(START_SERIES, '02x') + format(loop, "02x") + format(len(zones), "04x") + zonestring)
+
+
+def legacy_actions(elc, actions):
+    fragment = format(ADD_ACTION, '02x')
+    for k in actions:
+        fragment += legacy_action(k)
+    return legacy(elc, fragment)
+
+
+def legacy_dim(elc, zones, dimming):
+    zonestring = "".join(format(x, '02x') for x in zones)
+    return legacy(elc, format(DIMMING, '02x') + format(dimming, '02x') + format(len(zones), '04x') + zonestring)
+
+
+def legacy_color(elc, zones, red, green, blue):
+    zonestring = "".join(format(x, '02x') for x in zones)
+    return legacy(elc, format(SET_COLOR, '02x') + format(red, '02x') + format(green, '02x') + format(blue, '02x') + format(len(zones), '04x') + zonestring)
+
+
+def main():
+    elc = Elc(0, 0, device=NullDevice())
+    cases = [
+        ("animation", lambda: legacy_animation(elc, REMOVE, AC_CHARGING),
+                      lambda: elc.encode_animation(REMOVE, AC_CHARGING)),
+        ("series", lambda: legacy_series(elc, ZONES),
+                   lambda: elc.encode_series(ZONES)),
+        ("add_action x3", lambda: legacy_actions(elc, ACTIONS),
+                          lambda: elc.encode_actions(ACTIONS)),
+        ("dim", lambda: legacy_dim(elc, ZONES, 50),
+                lambda: elc.encode_dim(ZONES, 50)),
+        ("set_color", lambda: legacy_color(elc, ZONES, 10, 20, 30),
+                      lambda: elc.encode_color(ZONES, 10, 20, 30)),
+    ]
+    number = 100000
+    print("{:<16}{:>12}{:>12}{:>9}".format("command", "hex ns", "struct ns", "speedup"))
+    for name, before, after in cases:
+        assert bytes(before()) == bytes(after()), name
+        t_before = min(timeit.repeat(before, number=number, repeat=5)) / number * 1e9
+        t_after = min(timeit.repeat(after, number=number, repeat=5)) / number * 1e9
+        print("{:<16}{:>12.0f}{:>12.0f}{:>8.1f}x".format(name, t_before, t_after, t_before / t_after))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+"""Check the AC/battery watcher on a simulated /sys/class/power_supply.
+
+A temporary directory with an "AC" mains supply and a "BAT0" battery
+stands in for sysfs. The script flips AC/online and reports how long the
+watcher took to notice, that rewriting the same value reports nothing and
+that no event arrives while nothing changes. It then runs the daemon on
+the same directory, with the fake ACPI helper and no hwmon sensors, times
+a plug/unplug until its power mode write and checks that a client watching
+the power mode is told. Exits non-zero on the first failure.
+"""
+import os
+import sys
+import time
+import shutil
+import select
+import asyncio
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fakes import fake_acpi_call, start_fake_helper
+from hwmon import HwmonSensors
+from power_source import PowerSourceWatcher, SourceProfiles, AC, BATTERY
+
+
+def make_supplies(root):
+    for name, kind, online in (("AC", "Mains", "1"), ("BAT0", "Battery", None)):
+        os.mkdir(os.path.join(root, name))
+        with open(os.path.join(root, name, "type"), "w") as f:
+            f.write(kind + "\n")
+        if online is not None:
+            set_online(root, online)
+
+
+def set_online(root, value):
+    with open(os.path.join(root, "AC", "online"), "w") as f:
+        f.write(value + "\n")
+
+
+def check_watcher(root):
+    changes = []
+    watcher = PowerSourceWatcher(changes.append, root)
+    if watcher.start() != AC:
+        return "initial source is not AC"
+    try:
+        if select.select([watcher], [], [], 0.2)[0]:
+            return "event without a change"
+        for value, expected in (("0", BATTERY), ("0", None), ("1", AC), ("0", BATTERY), ("1", AC)):
+            changes.clear()
+            start = time.perf_counter()
+            set_online(root, value)
+            while select.select([watcher], [], [], 0.05)[0]:
+                watcher.handle()
+                if changes:
+                    break
+            elapsed = time.perf_counter() - start
+            got = changes[0] if changes else None
+            if got != expected:
+                return "online={} reported {}, expected {}".format(value, got, expected)
+            print("online={} -> {:<8} {:7.3f} ms".format(value, str(got), elapsed * 1000))
+    finally:
+        watcher.close()
+    return None
+
+
+async def check_daemon(root, work):
+    from acpi import Acpi
+    from daemon import Daemon
+    import client
+    import models
+    call_file = fake_acpi_call("0x0")
+    helper = start_fake_helper(call_file)
+    acpi = Acpi(helper)
+    profiles = SourceProfiles(os.path.join(work, "power_sources.json"))
+    hwmon_root = os.path.join(work, "hwmon")
+    os.mkdir(hwmon_root)
+    path = os.path.join(work, "daemon.sock")
+    daemon = Daemon(path, acpi=acpi, model=models.MODELS[0], supply_root=root, profiles=profiles,
+                    sensors=HwmonSensors(hwmon_root).open())
+    switches = []
+    watcher = None
+    try:
+        await daemon.start(open_acpi=False)
+        watcher = client.Client(path)
+        watcher.on_power_mode = lambda mode, source: switches.append((mode, source))
+        await asyncio.get_running_loop().run_in_executor(None, watcher.watch_power)
+        threading.Thread(target=watcher.listen, daemon=True).start()
+        await daemon.op_set_source_profile("set_source_profile", BATTERY, "USTT_BatterySaver", fan1=0x40)
+        await daemon.op_set_source_profile("set_source_profile", AC, "G Mode")
+        for value, source in (("0", BATTERY), ("1", AC)):
+            calls = acpi.calls
+            start = time.perf_counter()
+            set_online(root, value)
+            while acpi.calls == calls and time.perf_counter() - start < 1.0:
+                await asyncio.sleep(0.0005)
+            elapsed = time.perf_counter() - start
+            # Let the rest of the profile finish
+            await asyncio.sleep(0.05)
+            if acpi.calls == calls:
+                return "no ACPI write after switching to {}".format(source)
+            print("daemon on {:<8} first write after {:7.3f} ms, {} ACPI calls".format(
+                source, elapsed * 1000, acpi.calls - calls))
+        state = await daemon.op_get_power_source("get_power_source")
+        if state["source"] != AC:
+            return "daemon reports {}".format(state["source"])
+        if switches != [("USTT_BatterySaver", BATTERY), ("G Mode", AC)]:
+            return "watching client was told {}".format(switches)
+    finally:
+        if watcher is not None:
+            watcher.close()
+        await daemon.close()
+        helper.close()
+        os.unlink(call_file)
+    return None
+
+
+def main():
+    work = tempfile.mkdtemp(prefix="dgsc-check")
+    os.environ["XDG_CACHE_HOME"] = work
+    try:
+        root = os.path.join(work, "power_supply")
+        os.mkdir(root)
+        make_supplies(root)
+        error = check_watcher(root) or asyncio.run(check_daemon(root, work))
+    finally:
+        shutil.rmtree(work)
+    if error:
+        print("FAIL:", error)
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+"""Check the optimized lighting paths against the emulated controller.
+
+Each awelc operation is run through a session on an ElcEmulator and the
+resulting controller state is compared with the state left by the plain
+command sequence, one report and one status read per command. Transfer
+counts of both are printed. Exits non-zero on the first mismatch.
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Keep the animation and profile caches away from the user's
+CACHE = tempfile.mkdtemp(prefix="dgsc-check")
+os.environ["XDG_CACHE_HOME"] = CACHE
+
+import awelc
+from elc import Elc
+from elc_emulator import ElcEmulator
+
+
+def reference(animations, *args):
+    """State and transfers of the unoptimized sequence for animations(*args)."""
+    emulator = ElcEmulator(strict=True)
+    elc = Elc(awelc.VID, emulator.idProduct, device=emulator)
+    elc.dim(awelc.ZONES, 0)
+    for animation, builder, builder_args in animations(*args):
+        builder(elc, *builder_args)
+    return emulator.snapshot(), emulator.transfers
+
+
+def main():
+    emulator = ElcEmulator(strict=True)
+    session = awelc.ElcSession(device=emulator)
+    cases = [
+        ("set_static", awelc.set_static, awelc.static_animations, (10, 20, 30)),
+        ("set_static (same colors)", awelc.set_static, awelc.static_animations, (10, 20, 30)),
+        ("set_static (new colors)", awelc.set_static, awelc.static_animations, (200, 100, 0)),
+        ("set_morph", awelc.set_morph, awelc.morph_animations, (10, 20, 30, 0x100)),
+        ("set_color_and_morph", awelc.set_color_and_morph, awelc.color_and_morph_animations,
+         (1, 2, 3, 4, 5, 6, 0x200)),
+        ("set_static (verify)", lambda *a, **k: awelc.set_static(*a, verify=True, **k),
+         awelc.static_animations, (200, 100, 0)),
+    ]
+    failed = 0
+    print("{:<40}{:>10}{:>11}".format("operation", "transfers", "reference"))
+    for name, operation, animations, args in cases:
+        expected, reference_transfers = reference(animations, *args)
+        before = emulator.transfers
+        operation(*args, session=session)
+        transfers = emulator.transfers - before
+        state = emulator.snapshot()
+        ok = state == expected and not emulator.errors
+        print("{:<40}{:>10}{:>11}{}".format(name, transfers, reference_transfers, "" if ok else "  MISMATCH"))
+        if not ok:
+            print("  expected", expected)
+            print("  got     ", state)
+            print("  errors  ", emulator.errors)
+            failed += 1
+
+    before = emulator.transfers
+    awelc.remove_animation(session=session)
+    transfers = emulator.transfers - before
+    ok = not emulator.animations and set(emulator.dimming.values()) == {100}
+    print("{:<40}{:>10}{:>11}{}".format("remove_animation", transfers, "", "" if ok else "  MISMATCH"))
+    failed += not ok
+
+    # After a removal nothing is cached, so a re-apply must write everything again
+    expected, reference_transfers = reference(awelc.static_animations, 10, 20, 30)
+    before = emulator.transfers
+    awelc.set_static(10, 20, 30, session=session)
+    transfers = emulator.transfers - before
+    ok = emulator.snapshot() == expected and not emulator.errors
+    print("{:<40}{:>10}{:>11}{}".format("set_static (after removal)", transfers, reference_transfers, "" if ok else "  MISMATCH"))
+    failed += not ok
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    finally:
+        shutil.rmtree(CACHE)
@@ -0,0 +1,24 @@
+#!/usr/bin/python3
+"""acpi_helper with an artificial per-call latency (FAKE_ACPI_LATENCY seconds)."""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import acpi_helper
+
+LATENCY = float(os.environ.get("FAKE_ACPI_LATENCY", "0"))
+_call = acpi_helper.call
+
+
+def slow_call(fd, request):
+    time.sleep(LATENCY)
+    return _call(fd, request)
+
+
+if LATENCY:
+    acpi_helper.call = slow_call
+
+if __name__ == "__main__":
+    sys.exit(acpi_helper.main())
@@ -0,0 +1,77 @@
+"""Stand-in backends for benchmarking without the hardware."""
+import os
+import sys
+import time
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+FAKE_HELPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_acpi_helper.py")
+
+
+class FakeUsbDevice:
+    """Accepts every HID report and answers reads with the last one's id and command.
+
+    Each control transfer sleeps for latency seconds and is counted, so
+    operations can be measured in reports and transfers.
+    """
+
+    idProduct = 0x0550
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.reports = 0
+        self.reads = 0
+        self._reply = bytes(33)
+
+    def ctrl_transfer(self, bmRequestType, bRequest, wValue, wIndex, data_or_length):
+        if self.latency:
+            time.sleep(self.latency)
+        if bmRequestType & 0x80:
+            self.reads += 1
+            return self._reply[:data_or_length]
+        self.reports += 1
+        self._reply = bytes(data_or_length[:2]) + bytes(31)
+        return len(data_or_length)
+
+    @property
+    def transfers(self):
+        return self.reports + self.reads
+
+
+def fake_acpi_call(reply="0x2a"):
+    """Create a regular file standing in for /proc/acpi/call; returns its path."""
+    fd, path = tempfile.mkstemp(prefix="acpi_call")
+    os.write(fd, reply.encode() + b"\x00")
+    os.close(fd)
+    return path
+
+
+def start_fake_helper(call_file, latency=0.0):
+    """Start the ACPI helper unprivileged on call_file, each call taking latency more seconds."""
+    sys.path.insert(0, ROOT)
+    from acpi import AcpiHelper
+    os.environ["FAKE_ACPI_LATENCY"] = str(latency)
+    helper = AcpiHelper(call_file=call_file, elevate=False, helper=FAKE_HELPER)
+    if not helper.start():
+        raise RuntimeError("Cannot start the fake ACPI helper")
+    return helper
+
+
+def fake_hwmon(root):
+    """Fill root like /sys/class/hwmon with dell_smm fans and temperatures and coretemp."""
+    devices = {
+        "hwmon0": ("coretemp", {"temp1": ("Package id 0", 52000), "temp2": ("Core 0", 50000)}),
+        "hwmon1": ("dell_smm", {"fan1": ("Processor Fan", 2400), "fan2": ("Video Fan", 0),
+                                "temp1": ("CPU", 51000), "temp2": ("GPU", 43000)}),
+    }
+    for device, (driver, channels) in devices.items():
+        path = os.path.join(root, device)
+        os.makedirs(path)
+        with open(os.path.join(path, "name"), "w") as f:
+            f.write(driver + "\n")
+        for channel, (label, value) in channels.items():
+            with open(os.path.join(path, channel + "_label"), "w") as f:
+                f.write(label + "\n")
+            with open(os.path.join(path, channel + "_input"), "w") as f:
+                f.write("{}\n".format(value))
+    return root
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+"""Check the import cost of the headless CLI against a time budget.
+
+Each CLI path is imported in a fresh interpreter under python -X importtime,
+and the cumulative times of its modules are added up; interpreter startup
+is not counted. The check fails if a path goes over its budget (best of
+several runs), or if it pulls in Qt or pexpect. Run from the repository
+root:
+
+    python benchmarks/import_budget.py
+
+tests/test_import_budget.py runs the same check under the test runner.
+"""
+import os
+import sys
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Path: (modules a subcommand imports, budget in microseconds). Every
+# subcommand first looks for the daemon through client. The budgets leave
+# room for noisy machines; they are there to catch a heavy import.
+BUDGETS = {
+    "led": (["cli", "client", "awelc"], 100000),
+    "acpi": (["cli", "client", "acpi", "models", "power", "model_cache"], 50000),
+    "hwmon": (["cli", "client", "hwmon"], 50000),
+}
+FORBIDDEN = ("PySide6", "shiboken6", "pexpect")
+RUNS = 5
+
+
+def measure(modules):
+    """Return (total import microseconds of modules, imported module names)."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    total = 0
+    names = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        names.add(name.strip())
+        if name.strip() in modules and not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total, names
+
+
+def main():
+    failed = False
+    for path, (modules, budget) in BUDGETS.items():
+        try:
+            runs = [measure(modules) for _ in range(RUNS)]
+        except RuntimeError as err:
+            print("{:<6} cannot import: {}".format(path, err))
+            failed = True
+            continue
+        best = min(total for total, names in runs)
+        forbidden = sorted(name for name in runs[0][1] if name.split(".")[0] in FORBIDDEN)
+        ok = best <= budget and not forbidden
+        failed |= not ok
+        print("{:<6} {:>8.1f} ms (budget {:.0f} ms){}{}".format(
+            path, best / 1000, budget / 1000,
+            "" if not forbidden else ", imports " + ", ".join(forbidden),
+            "" if ok else "  FAIL"))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
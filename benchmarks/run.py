@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+"""Benchmarks of the USB and ACPI hot paths on stand-in backends.
+
+awelc/Elc run against a fake USB device and the ACPI layer against the
+real helper on a fake /proc/acpi/call, both with a configurable latency
+per transfer. For each operation the runner reports HID reports and
+control transfers per operation, wall time, and peak allocated memory.
+Run from the repository root:
+
+    python benchmarks/run.py --usb-latency 0.0005 --json results.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import platform
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fakes import FakeUsbDevice, fake_acpi_call, fake_hwmon, start_fake_helper
+
+
+class Result:
+    def __init__(self, name, iterations):
+        self.name = name
+        self.iterations = iterations
+        self.reports = 0
+        self.transfers = 0
+        self.acpi_calls = 0
+        self.wall = 0.0
+        self.peak = 0
+
+    def as_dict(self):
+        n = self.iterations
+        return {
+            "iterations": n,
+            "reports_per_op": self.reports / n,
+            "transfers_per_op": self.transfers / n,
+            "acpi_calls_per_op": self.acpi_calls / n,
+            "wall_ms": self.wall / n * 1000,
+            "peak_alloc_kib": self.peak / 1024,
+        }
+
+
+def bench(name, operation, iterations, device=None, acpi=None, setup=None):
+    """Time operation() and count its transfers and ACPI calls; setup() runs untimed before each call."""
+    result = Result(name, iterations)
+    for _ in range(iterations):
+        if setup:
+            setup()
+        if device:
+            reports, transfers = device.reports, device.transfers
+        if acpi:
+            calls = acpi.calls
+        start = time.perf_counter()
+        operation()
+        result.wall += time.perf_counter() - start
+        if device:
+            result.reports += device.reports - reports
+            result.transfers += device.transfers - transfers
+        if acpi:
+            result.acpi_calls += acpi.calls - calls
+
+    # Allocation pass, separate so tracing does not skew the timings
+    tracemalloc.start()
+    for _ in range(min(iterations, 10)):
+        if setup:
+            setup()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        operation()
+        result.peak = max(result.peak, tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return result
+
+
+def usb_benchmarks(args):
+    import awelc
+    device = FakeUsbDevice(args.usb_latency)
+    session = awelc.ElcSession(device=device)
+    session.open()
+    n = args.iterations
+    colors = iter(range(1 << 30))
+
+    def new_color():
+        c = next(colors)
+        return (c & 0xff, (c >> 8) & 0xff, 0x80)
+
+    return [
+        bench("set_static (all animations)", lambda: awelc.set_static(10, 20, 30, force=True, session=session), n, device),
+        bench("set_static (unchanged)", lambda: awelc.set_static(10, 20, 30, session=session), n, device),
+        bench("set_static (new color)", lambda: awelc.set_static(*new_color(), session=session), n, device),
+        bench("set_morph (all animations)", lambda: awelc.set_morph(10, 20, 30, 0x100, force=True, session=session), n, device),
+        bench("remove_animation", lambda: awelc.remove_animation(session=session), n, device),
+        bench("set_dim", lambda: awelc.set_dim(50, session=session), n, device),
+        bench("set_color (1 zone)", lambda: session.elc.set_color([0], 1, 2, 3), n, device),
+    ]
+
+
+def acpi_benchmarks(args):
+    from acpi import Acpi
+    import power
+    import hwmon
+    call_file = fake_acpi_call("0x0")
+    helper = start_fake_helper(call_file, args.acpi_latency)
+    hwmon_root = fake_hwmon(tempfile.mkdtemp(prefix="dgsc-hwmon"))
+    hwmon_sensors = hwmon.HwmonSensors(hwmon_root).open()
+    try:
+        acpi = Acpi(helper, ttl={})
+        cached = Acpi(helper)
+        sensors = ["get_fan1_rpm", "get_cpu_temp", "get_fan2_rpm", "get_gpu_temp"]
+        power_modes = {"Balanced": "0xa0", "G Mode": "0xab"}
+        state = power.PowerState(cached, power_modes)
+        toggle = itertools.cycle(["G Mode", "Balanced"])
+        n = args.iterations
+        return [
+            bench("acpi_call (single read)", lambda: acpi.call("get_cpu_temp"), n, acpi=acpi),
+            bench("telemetry tick (batch of 4)", lambda: acpi.call_batch(sensors), n, acpi=acpi),
+            bench("telemetry tick (4 single calls)", lambda: [acpi.call(key) for key in sensors], n, acpi=acpi),
+            bench("telemetry tick (cached, 1 s apart)", lambda: cached.call_batch(sensors), n, acpi=cached,
+                  setup=lambda: cached.invalidate(*sensors)),
+            bench("telemetry tick (hwmon)", lambda: hwmon.read(hwmon_sensors, sensors, acpi.call_batch), n,
+                  acpi=acpi),
+            bench("fan boost (uncached)", lambda: power.set_fan_boost(acpi, "fan1", 0x40), n, acpi=acpi),
+            bench("fan boost (cached)", lambda: power.set_fan_boost(cached, "fan1", 0x40), n, acpi=cached),
+            bench("power mode (uncached)", lambda: power.apply_power_mode(acpi, power_modes, "Balanced"), n, acpi=acpi),
+            bench("power mode (cached)", lambda: power.apply_power_mode(cached, power_modes, "Balanced"), n, acpi=cached),
+            bench("power mode (tracked, no change)", lambda: state.apply("Balanced"), n, acpi=cached),
+            bench("power mode (tracked, toggle)", lambda: state.apply(next(toggle)), n, acpi=cached),
+        ]
+    finally:
+        hwmon_sensors.close()
+        shutil.rmtree(hwmon_root)
+        helper.close()
+        os.unlink(call_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--usb-latency", type=float, default=0.0, help="seconds per USB control transfer")
+    parser.add_argument("--acpi-latency", type=float, default=0.0, help="seconds per ACPI call")
+    parser.add_argument("--json", help="write machine-readable results to this file ('-' for stdout)")
+    args = parser.parse_args()
+
+    # Keep the animation and profile caches away from the user's
+    cache = tempfile.mkdtemp(prefix="dgsc-bench")
+    os.environ["XDG_CACHE_HOME"] = cache
+    try:
+        results = usb_benchmarks(args) + acpi_benchmarks(args)
+    finally:
+        shutil.rmtree(cache)
+
+    print("{:<34}{:>9}{:>11}{:>7}{:>11}{:>11}".format("operation", "reports", "transfers", "acpi", "wall ms", "peak KiB"))
+    for result in results:
+        r = result.as_dict()
+        print("{:<34}{:>9.1f}{:>11.1f}{:>7.1f}{:>11.3f}{:>11.1f}".format(
+            result.name, r["reports_per_op"], r["transfers_per_op"], r["acpi_calls_per_op"],
+            r["wall_ms"], r["peak_alloc_kib"]))
+
+    if args.json:
+        data = {
+            "python": platform.python_version(),
+            "usb_latency": args.usb_latency,
+            "acpi_latency": args.acpi_latency,
+            "results": {result.name: result.as_dict() for result in results},
+        }
+        if args.json == "-":
+            json.dump(data, sys.stdout, indent=2)
+        else:
+            with open(args.json, "w") as f:
+                json.dump(data, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+#!/usr/bin/python3
+"""Headless control of the keyboard lights, power mode and fans.
+
+Every subcommand imports only what it needs: LED commands never load the
+ACPI helper client, and nothing here imports Qt. When the control daemon is
+running, lighting, power and fan commands are sent to it instead, so they
+skip device setup and the root prompt.
+"""
+import sys
+import argparse
+
+
+def _color(value):
+    value = int(value, 0)
+    if not 0 <= value <= 255:
+        raise argparse.ArgumentTypeError("color values go from 0 to 255")
+    return value
+
+
+def _acpi():
+    from acpi import Acpi, AcpiHelper
+    import models
+    helper = AcpiHelper()
+    if not helper.start():
+        raise SystemExit("No root access, power related functions are not available.")
+    detected = models.identify(helper)
+    if detected is None:
+        helper.close()
+        raise SystemExit("Laptop model is NOT supported.")
+    model = detected[0]
+    return Acpi(helper, model.wmax), model
+
+
+def _daemon():
+    """A connection to the running daemon, or None to use the devices directly."""
+    import client
+    return client.connect()
+
+
+def _lights(operation, *args, **kwargs):
+    daemon = _daemon()
+    if daemon is not None:
+        with daemon:
+            return daemon.request(operation, *args, **kwargs)
+    import awelc
+    return getattr(awelc, operation)(*args, **kwargs)
+
+
+def cmd_static(args):
+    _lights("set_static", args.red, args.green, args.blue, force=args.force)
+
+
+def cmd_morph(args):
+    _lights("set_morph", args.red, args.green, args.blue, args.duration, force=args.force)
+
+
+def cmd_dim(args):
+    _lights("set_dim", args.level)
+
+
+def cmd_off(args):
+    _lights("remove_animation")
+
+
+def cmd_status(args):
+    daemon = _daemon()
+    if daemon is not None:
+        with daemon:
+            status = daemon.status()
+        version, count, last = tuple(status["firmware"]), status["animations"], status["last_id"]
+    else:
+        import awelc
+        with awelc.get_session() as session:
+            version = session.elc.get_version()
+            count, last = session.elc.get_animation_count()
+    print("Firmware: %d.%d.%d" % version)
+    print("Animations: {} (last id 0x{:04x})".format(count, last))
+
+
+def cmd_effect(args):
+    if not args.measure and args.name is None:
+        import effects
+        raise SystemExit("Choose an effect: {}".format(", ".join(effects.EFFECTS)))
+    daemon = _daemon()
+    if daemon is not None:
+        with daemon:
+            _effect_daemon(daemon, args)
+        return
+    import awelc
+    import effects
+    with awelc.get_session() as session:
+        if args.measure:
+            print("Maximum sustainable frame rate: {:.1f} fps".format(effects.measure_max_fps(session.elc)))
+            return
+        engine = effects.EffectsEngine(session.elc, effects.create(args.name, args.color), fps=args.fps)
+        try:
+            stats = engine.run(duration=args.seconds)
+        except KeyboardInterrupt:
+            return
+    print(stats)
+
+
+def _effect_daemon(daemon, args):
+    """Play the effect in the daemon, which keeps the device claimed."""
+    import time
+    if args.measure:
+        print("Maximum sustainable frame rate: {:.1f} fps".format(daemon.measure_fps()))
+        return
+    daemon.start_effect(args.name, args.fps, args.seconds, args.color)
+    try:
+        if args.seconds is not None:
+            time.sleep(args.seconds)
+        else:
+            while True:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        daemon.stop_effect()
+        return
+    print(daemon.stop_effect())
+
+
+def cmd_power(args):
+    daemon = _daemon()
+    if daemon is not None:
+        with daemon:
+            info = daemon.info()
+            if args.mode is None:
+                print("Model: Dell {}".format(info["model"]))
+                print("Power mode: {}".format(daemon.get_power_mode()))
+                print("Available: {}".format(", ".join(info["power_modes"])))
+            elif args.mode not in info["power_modes"]:
+                raise SystemExit("Unknown power mode {!r}, choose from: {}".format(
+                    args.mode, ", ".join(info["power_modes"])))
+            else:
+                daemon.set_power_mode(args.mode)
+        return
+    import power
+    acpi, model = _acpi()
+    try:
+        if args.mode is None:
+            print("Model: Dell {}".format(model.name))
+            print("Power mode: {}".format(power.get_power_mode(acpi, model.power_modes)))
+            print("Available: {}".format(", ".join(model.power_modes)))
+        elif args.mode not in model.power_modes:
+            raise SystemExit("Unknown power mode {!r}, choose from: {}".format(
+                args.mode, ", ".join(model.power_modes)))
+        else:
+            power.apply_power_mode(acpi, model.power_modes, args.mode)
+    finally:
+        acpi.helper.close()
+
+
+FAN_READINGS = ["get_fan1_rpm", "get_cpu_temp", "get_fan2_rpm", "get_gpu_temp"]
+FAN_BOOSTS = ["get_fan1_boost", "get_fan2_boost"]
+
+
+def _fans(set_fan_boost, read, args, boosts=True):
+    for fan, boost in (("fan1", args.fan1), ("fan2", args.fan2)):
+        if boost is not None:
+            last_boost, new_boost = set_fan_boost(fan, boost)
+            print("{} boost: {} -> {}".format(fan.capitalize(), last_boost, new_boost))
+    if args.fan1 is None and args.fan2 is None:
+        values = read(FAN_READINGS + (FAN_BOOSTS if boosts else []))
+        for name, fan, temp in (("CPU", "fan1", "get_cpu_temp"), ("GPU", "fan2", "get_gpu_temp")):
+            line = "{} fan: {} RPM, {} °C".format(name, values["get_{}_rpm".format(fan)], values[temp])
+            if boosts:
+                line += ", boost {}".format(values["get_{}_boost".format(fan)])
+            print(line)
+
+
+def _acpi_read(keys):
+    acpi, model = _acpi()
+    try:
+        return acpi.call_batch(keys)
+    finally:
+        acpi.helper.close()
+
+
+def cmd_fans(args):
+    daemon = _daemon()
+    if daemon is not None:
+        with daemon:
+            _fans(daemon.set_fan_boost, daemon.read, args, boosts=daemon.info()["acpi"])
+        return
+    if args.fan1 is None and args.fan2 is None:
+        # Readings only: hwmon has them without root on many kernels
+        import hwmon
+        sensors = hwmon.HwmonSensors().open()
+        try:
+            if sensors.keys.issuperset(FAN_READINGS):
+                # A channel that fails to read is asked through ACPI instead
+                _fans(None, lambda keys: hwmon.read(sensors, keys, _acpi_read), args, boosts=False)
+                return
+        finally:
+            sensors.close()
+    import power
+    acpi, model = _acpi()
+    try:
+        _fans(lambda fan, boost: power.set_fan_boost(acpi, fan, boost), acpi.call_batch, args)
+    finally:
+        acpi.helper.close()
+
+
+def cmd_source(args):
+    daemon = _daemon()
+    if daemon is None:
+        raise SystemExit("Power source profiles are applied by the daemon, which is not running.")
+    with daemon:
+        if args.source is None:
+            state = daemon.get_power_source()
+            print("Power source: {}".format(state["source"] or "not watched"))
+            for source in ("ac", "battery"):
+                profile = state["profiles"].get(source, {})
+                print("On {}: {}".format(source, ", ".join(
+                    "{} {}".format(key, value) for key, value in sorted(profile.items())) or "no change"))
+        else:
+            daemon.set_source_profile(args.source, args.mode, args.fan1, args.fan2)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="awelc", description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    static = commands.add_parser("static", help="static keyboard color")
+    morph = commands.add_parser("morph", help="keyboard color morph")
+    for sub in (static, morph):
+        sub.add_argument("red", type=_color)
+        sub.add_argument("green", type=_color)
+        sub.add_argument("blue", type=_color)
+        sub.add_argument("--force", action="store_true", help="rewrite unchanged animations too")
+    morph.add_argument("--duration", type=lambda v: int(v, 0), default=255)
+    static.set_defaults(func=cmd_static)
+    morph.set_defaults(func=cmd_morph)
+
+    dim = commands.add_parser("dim", help="dim the keyboard, 0 (bright) to 100 (off)")
+    dim.add_argument("level", type=int, choices=range(0, 101), metavar="LEVEL")
+    dim.set_defaults(func=cmd_dim)
+
+    off = commands.add_parser("off", help="remove all animations")
+    off.set_defaults(func=cmd_off)
+
+    status = commands.add_parser("status", help="LED controller firmware and animations")
+    status.set_defaults(func=cmd_status)
+
+    effect = commands.add_parser("effect", help="play a host-driven effect until interrupted")
+    effect.add_argument("name", nargs="?", choices=["wave", "breathing", "fire"])
+    effect.add_argument("--fps", type=int, default=30)
+    effect.add_argument("--seconds", type=float, help="stop after this many seconds")
+    effect.add_argument("--color", type=_color, nargs=3, metavar=("RED", "GREEN", "BLUE"),
+                        help="breathing color")
+    effect.add_argument("--measure", action="store_true",
+                        help="measure the maximum frame rate of the controller")
+    effect.set_defaults(func=cmd_effect)
+
+    power = commands.add_parser("power", help="show or set the power mode")
+    power.add_argument("mode", nargs="?")
+    power.set_defaults(func=cmd_power)
+
+    fans = commands.add_parser("fans", help="show fans and temperatures, or set fan boost")
+    fans.add_argument("--fan1", type=_color, metavar="BOOST", help="CPU fan boost, 0-255")
+    fans.add_argument("--fan2", type=_color, metavar="BOOST", help="GPU fan boost, 0-255")
+    fans.set_defaults(func=cmd_fans)
+
+    source = commands.add_parser("source", help="show or set what to switch to on AC and on battery")
+    source.add_argument("source", nargs="?", choices=["ac", "battery"])
+    source.add_argument("--mode", help="power mode")
+    source.add_argument("--fan1", type=_color, metavar="BOOST", help="CPU fan boost, 0-255")
+    source.add_argument("--fan2", type=_color, metavar="BOOST", help="GPU fan boost, 0-255")
+    source.set_defaults(func=cmd_source)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except Exception as err:
+        print("{}: {}".format(err.__class__.__name__, err), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
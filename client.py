@@ -0,0 +1,138 @@
+"""Blocking client of the control daemon (see daemon.py)."""
+import os
+import sys
+import json
+import time
+import socket
+import threading
+from paths import socket_path
+
+DAEMON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "daemon.py")
+
+
+class DaemonError(Exception):
+    """An operation failed in the daemon."""
+
+
+class Client:
+    """One connection to the daemon.
+
+    request() is thread-safe but calls on one connection run one at a time;
+    open one Client per thread that needs its calls to overlap with another's.
+    Telemetry events arriving on a subscribed connection are passed to
+    on_event(values), and after watch_power power mode switches to
+    on_power_mode(mode, source), from the thread that reads them.
+    """
+
+    def __init__(self, path=None, timeout=30.0):
+        self.path = path or socket_path()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(self.path)
+        self.file = self.sock.makefile("rb")
+        self.on_event = None
+        self.on_power_mode = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def request(self, op, *args, **kwargs):
+        with self._lock:
+            self._next_id += 1
+            message = {"id": self._next_id, "op": op, "args": args}
+            if kwargs:
+                message["kwargs"] = kwargs
+            self.sock.sendall(json.dumps(message).encode() + b"\n")
+            while True:
+                reply = self._read()
+                if reply.get("id") == self._next_id:
+                    break
+        if "error" in reply:
+            raise DaemonError(reply["error"])
+        return reply.get("result")
+
+    def events(self):
+        """Yield telemetry values as they arrive, after a subscribe."""
+        while True:
+            with self._lock:
+                message = self._read()
+            if message.get("event") == "telemetry":
+                yield message["values"]
+
+    def listen(self):
+        """Dispatch events to the handlers until the connection is closed."""
+        try:
+            while True:
+                with self._lock:
+                    self._read()
+        except (OSError, ValueError):
+            pass
+
+    def _read(self):
+        while True:
+            line = self.file.readline()
+            if not line:
+                raise ConnectionError("Daemon closed the connection")
+            message = json.loads(line)
+            event = message.get("event")
+            if event == "telemetry" and self.on_event is not None:
+                self.on_event(message["values"])
+                continue
+            if event == "power_mode" and self.on_power_mode is not None:
+                self.on_power_mode(message["mode"], message["source"])
+                continue
+            return message
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)    # Wakes a thread blocked in listen()
+        except OSError:
+            pass
+        self.file.close()
+        self.sock.close()
+
+    def __getattr__(self, op):
+        if op.startswith("_"):
+            raise AttributeError(op)
+        return lambda *args, **kwargs: self.request(op, *args, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def connect(path=None, start=False, wait=60.0):
+    """Connect to the daemon; with start, launch it first if it is not running.
+
+    Returns None if no daemon is running and start is False. The wait
+    covers the daemon's pkexec prompt.
+    """
+    try:
+        path = path or socket_path()
+    except PermissionError:
+        # The runtime directory is not ours, so no daemon of ours listens there
+        if not start:
+            return None
+        raise
+    try:
+        return Client(path)
+    except OSError:
+        if not start:
+            return None
+    import subprocess   # Only needed to start the daemon; keeps cli.py quick to import
+    process = subprocess.Popen([sys.executable, DAEMON, "--socket", path],
+                               stdin=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            # Lost a race with another instance, which then serves us
+            try:
+                return Client(path)
+            except OSError:
+                raise DaemonError("Daemon exited with status {}".format(process.returncode))
+        try:
+            return Client(path)
+        except OSError:
+            time.sleep(0.05)
+    raise DaemonError("Daemon did not start within {:.0f} s".format(wait))
@@ -0,0 +1,522 @@
+#!/usr/bin/python3
+"""Control daemon: the single owner of the lighting controller and the ACPI helper.
+
+Clients (the GUI, cli.py, scripts) talk to it over a Unix socket in the
+user's runtime directory, so device setup and the pkexec prompt happen once
+per session instead of once per command. The protocol is one JSON object
+per line:
+
+    {"id": 1, "op": "set_static", "args": [255, 0, 0], "kwargs": {"force": false}}
+    {"id": 1, "result": null}
+    {"id": 2, "op": "nope"}
+    {"id": 2, "error": "ValueError: unknown operation nope"}
+
+After {"op": "subscribe", "args": [[keys]]} the connection also receives
+{"event": "telemetry", "values": {...}} lines whenever a subscribed sensor
+was read, until it sends "unsubscribe" or disconnects. Sensors with a
+/sys/class/hwmon channel are read from there, so "read" and "subscribe"
+work for them without root; the others go through ACPI.
+
+When the laptop switches between AC and battery the daemon applies the
+power mode and fan boosts stored for that source with "set_source_profile".
+A connection that sent "watch_power" receives
+{"event": "power_mode", "mode": ..., "source": ...} whenever the power mode
+was switched, by a client (source null) or for a power source.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import logging
+import functools
+import argparse
+
+import aio
+import log
+from telemetry import SENSORS, TelemetryScheduler
+from hwmon import HwmonSensors
+from power_source import PowerSourceWatcher, SourceProfiles, SUPPLY_DIR, SOURCES
+from paths import socket_path, state_dir
+
+logger = logging.getLogger("dgsc.daemon")
+
+# Telemetry events are dropped for clients that stop reading
+MAX_BACKLOG = 1 << 16
+
+
+class DaemonRunning(Exception):
+    pass
+
+
+class Daemon:
+    """Serves the control API until stopped.
+
+    session and acpi can be given (an ElcSession, an Acpi with a started
+    helper) instead of the real devices, and supply_root and profiles (a
+    directory of fake power supplies, a SourceProfiles) and sensors (an
+    opened HwmonSensors) instead of the system's, for testing.
+    """
+
+    def __init__(self, path=None, session=None, acpi=None, model=None, supply_root=SUPPLY_DIR, profiles=None,
+                 sensors=None):
+        self.path = path or socket_path()
+        self.devices = aio.Devices()
+        self.lights = aio.AsyncLights(self.devices, session)
+        self.acpi = aio.AsyncAcpi(self.devices, acpi) if acpi is not None else None
+        self.model = model
+        self.code = None
+        self.supported = model is not None
+        self.power_modes = dict(model.power_modes) if model is not None else {}
+        self.power_state = None
+        self.telemetry = None
+        self.sensors = sensors
+        self.supply_root = supply_root
+        self.profiles = profiles
+        self.watcher = None
+        self._effect = None
+        self._power_watchers = set()
+        self.server = None
+        self._wake = asyncio.Event()
+        self._telemetry_task = None
+        self._ops = {
+            "ping": self.op_ping,
+            "info": self.op_info,
+            "override_model": self.op_override_model,
+            "set_static": self.op_lights,
+            "set_morph": self.op_lights,
+            "set_color_and_morph": self.op_lights,
+            "remove_animation": self.op_lights,
+            "set_dim": self.op_lights,
+            "set_colors": self.op_lights,
+            "status": self.op_status,
+            "start_effect": self.op_start_effect,
+            "stop_effect": self.op_stop_effect,
+            "measure_fps": self.op_measure_fps,
+            "get_power_mode": self.op_get_power_mode,
+            "set_power_mode": self.op_set_power_mode,
+            "set_fan_boost": self.op_set_fan_boost,
+            "write_fan_boost": self.op_write_fan_boost,
+            "read": self.op_read,
+            "get_power_source": self.op_get_power_source,
+            "set_source_profile": self.op_set_source_profile,
+        }
+
+    # Setup
+
+    def _claim_socket(self):
+        """Remove a stale socket, or raise DaemonRunning if another daemon answers on it."""
+        if not os.path.exists(self.path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except OSError:
+            os.unlink(self.path)
+        else:
+            raise DaemonRunning("A daemon is already listening on {}".format(self.path))
+        finally:
+            probe.close()
+
+    def _open_acpi(self):
+        """Start the privileged helper and identify the laptop. Runs on the acpi lane."""
+        from acpi import Acpi, AcpiHelper, AMD_WMAX
+        import models
+        helper = AcpiHelper(elevate=os.geteuid() != 0)
+        if not helper.start():
+            return None
+        acpi = Acpi(helper, AMD_WMAX)
+        detected = models.identify(helper)
+        if detected is not None:
+            self.model, self.code = detected
+            self.supported = True
+            self.power_modes = dict(self.model.power_modes)
+            acpi.wmax = self.model.wmax
+        else:
+            self.power_modes = dict(models.POWER_MODES)
+        return acpi
+
+    async def start(self, open_acpi=True):
+        self._claim_socket()
+        if self.sensors is None:
+            self.sensors = HwmonSensors().open()
+        self.telemetry = TelemetryScheduler()
+        self._telemetry_task = asyncio.ensure_future(self._telemetry_loop())
+        if self.acpi is None and open_acpi:
+            acpi = await self.devices.run("acpi", self._open_acpi, timeout=None)
+            if acpi is not None:
+                self.acpi = aio.AsyncAcpi(self.devices, acpi)
+        # An unrecognized laptop waits for override_model before any WMAX call
+        if self.acpi is not None and self.supported:
+            self._enable_acpi()
+        old_umask = os.umask(0o177)
+        try:
+            self.server = await asyncio.start_unix_server(self._serve, self.path)
+        finally:
+            os.umask(old_umask)
+        logger.info("Daemon listening on %s", self.path)
+
+    def _enable_acpi(self):
+        import power
+        self.power_state = power.PowerState(self.acpi.acpi, self.power_modes)
+        # Seeded now so the first switch needs no reads; apply() reads it again if this fails
+        self.devices.executor("acpi").submit(self.power_state.refresh)
+        self._watch_power_source()
+
+    def _watch_power_source(self):
+        if self.profiles is None:
+            self.profiles = SourceProfiles()
+        watcher = PowerSourceWatcher(self._power_source_changed, self.supply_root)
+        try:
+            source = watcher.start()
+        except OSError as err:
+            logger.warning("Cannot watch the power source: %s", err)
+            watcher.close()
+            return
+        asyncio.get_running_loop().add_reader(watcher.fileno(), watcher.handle)
+        self.watcher = watcher
+        logger.info("Running on %s", source)
+
+    def _power_source_changed(self, source):
+        asyncio.ensure_future(self._apply_source_profile(source))
+
+    async def _apply_source_profile(self, source):
+        profile = self.profiles.get(source)
+        writes = []
+        try:
+            if "power_mode" in profile and profile["power_mode"] in self.power_modes:
+                writes = await self.devices.run("acpi", self.power_state.apply, profile["power_mode"])
+                logger.info("Switched to %s on %s (%d writes)", profile["power_mode"], source, len(writes))
+            # After the mode, which can reset the boosts
+            for fan in ("fan1", "fan2"):
+                if fan in profile:
+                    await self.acpi.call("set_{}_boost".format(fan), "0x{:02X}".format(profile[fan]))
+        except Exception as err:
+            logger.warning("Cannot apply the %s profile: %s: %s", source, err.__class__.__name__, err)
+        if writes:
+            self._power_mode_switched(profile["power_mode"], source)
+
+    def _power_mode_switched(self, mode, source=None):
+        """Tell the watching clients, so their mode display and fan curves follow."""
+        for writer in list(self._power_watchers):
+            self._send(writer, {"event": "power_mode", "mode": mode, "source": source})
+
+    async def run(self):
+        """Serve until cancelled."""
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self._telemetry_task is not None:
+            self._telemetry_task.cancel()
+            self._telemetry_task = None
+        if self.watcher is not None:
+            asyncio.get_running_loop().remove_reader(self.watcher.fileno())
+            self.watcher.close()
+            self.watcher = None
+        if self.sensors is not None:
+            self.sensors.close()
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        if self.acpi is not None:
+            await self.devices.run("acpi", self.acpi.acpi.helper.close, timeout=None)
+        await self._stop_effect()
+        session = self.lights.session
+        if session is not None:
+            await self.devices.run("usb", session.close, timeout=None)
+        self.devices.shutdown()
+
+    # Connections
+
+    async def _serve(self, reader, writer):
+        consumer = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    op = request["op"]
+                except (ValueError, KeyError, TypeError) as err:
+                    self._send(writer, {"error": "Malformed request: {}".format(err)})
+                    continue
+                reply = {"id": request.get("id")}
+                try:
+                    if op == "subscribe":
+                        consumer = self._subscribe(writer, consumer, *request.get("args", []))
+                        reply["result"] = None
+                    elif op == "unsubscribe":
+                        self._unsubscribe(consumer)
+                        consumer = None
+                        reply["result"] = None
+                    elif op == "watch_power":
+                        self._power_watchers.add(writer)
+                        reply["result"] = None
+                    else:
+                        handler = self._ops.get(op)
+                        if handler is None:
+                            raise ValueError("unknown operation {}".format(op))
+                        reply["result"] = await handler(op, *request.get("args", []), **request.get("kwargs", {}))
+                except Exception as err:
+                    reply["error"] = "{}: {}".format(err.__class__.__name__, err)
+                self._send(writer, reply)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._unsubscribe(consumer)
+            self._power_watchers.discard(writer)
+            writer.close()
+
+    def _send(self, writer, message):
+        writer.write(json.dumps(message).encode() + b"\n")
+
+    def _subscribe(self, writer, consumer, keys):
+        # Checked before anything changes, so a bad request leaves the old subscription
+        if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+            raise ValueError("subscribe takes a list of sensor names")
+        unknown = [key for key in keys if key not in SENSORS]
+        if unknown:
+            raise ValueError("Not a sensor: {}".format(", ".join(unknown)))
+        if set(keys) - self.sensors.keys:
+            self._require_acpi()
+        self._unsubscribe(consumer)
+
+        def consumer(values):
+            if writer.transport.get_write_buffer_size() < MAX_BACKLOG:
+                self._send(writer, {"event": "telemetry", "values": values})
+        self.telemetry.subscribe(consumer, keys)
+        self._wake.set()
+        return consumer
+
+    def _unsubscribe(self, consumer):
+        if consumer is not None:
+            self.telemetry.unsubscribe(consumer)
+
+    async def _telemetry_loop(self):
+        while True:
+            try:
+                await self._telemetry_step()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Keep serving the other subscribers; back off so a persistent bug cannot spin
+                logger.exception("Telemetry loop failed")
+                await asyncio.sleep(1.0)
+
+    async def _telemetry_step(self):
+        """Wait for the next due sensors and read them."""
+        telemetry = self.telemetry
+        deadline = telemetry.next_deadline()
+        delay = None if deadline is None else deadline - time.monotonic()
+        if delay is None or delay > 0:
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+        keys = telemetry.due(time.monotonic())
+        if not keys:
+            return
+        try:
+            values = await self._read_sensors(keys)
+        except Exception as err:
+            logger.warning("Cannot read sensors: %s: %s", err.__class__.__name__, err)
+            telemetry.failed(keys, time.monotonic())
+        else:
+            telemetry.update(values, time.monotonic())
+
+    async def _read_sensors(self, keys):
+        """Read keys from hwmon where it has them, the rest through ACPI in one batch."""
+        values = {}
+        if self.sensors.keys.intersection(keys):
+            values = await self.devices.run("hwmon", self.sensors.read, keys)
+        rest = [key for key in keys if key not in values]
+        if rest:
+            self._require_acpi()
+            values.update(await self.acpi.call_batch(rest))
+        return values
+
+    # Operations
+
+    def _require_acpi(self):
+        if self.acpi is None:
+            raise PermissionError("ACPI methods are not available (no root access)")
+        if not self.supported:
+            raise PermissionError("Laptop model is not supported")
+
+    async def op_ping(self, op):
+        return "pong"
+
+    async def op_info(self, op):
+        return {
+            "model": self.model.name if self.model is not None else None,
+            "model_code": self.code,
+            "keyboard": self.model.keyboard if self.model is not None else True,
+            "acpi": self.acpi is not None,
+            "supported": self.supported,
+            "power_modes": list(self.power_modes),
+            "sensors": sorted(self.sensors.keys),
+        }
+
+    async def op_override_model(self, op):
+        """Use the ACPI methods on an unrecognized laptop anyway (G15 5525 calls)."""
+        if self.acpi is None:
+            raise PermissionError("ACPI methods are not available (no root access)")
+        self.supported = True
+        if self.power_state is None:
+            self._enable_acpi()
+        return None
+
+    async def op_lights(self, op, *args, **kwargs):
+        await self._stop_effect()
+        return await getattr(self.lights, op)(*args, **kwargs)
+
+    async def op_status(self, op):
+        """Firmware version and stored animations of the lighting controller."""
+        version = await self.lights.get_version()
+        count, last = await self.lights.get_animation_count()
+        return {"firmware": list(version), "animations": count, "last_id": last}
+
+    async def op_start_effect(self, op, name, fps=30, duration=None, color=None):
+        """Play a host-driven effect until stop_effect, another lighting op or duration seconds."""
+        import effects
+        effect = effects.create(name, color)
+        if not 1 <= fps <= 120:
+            raise ValueError("Bad frame rate {}".format(fps))
+        await self._stop_effect()
+        engine = effects.EffectsEngine(None, effect, fps=fps)
+        stats = effects.EffectStats()
+        # Frame by frame on the usb lane, so status and other requests fit in between
+        task = asyncio.ensure_future(engine.play(functools.partial(self.lights.run, _render_frame, engine),
+                                                 duration, stats))
+        task.add_done_callback(_log_effect_error)
+        self._effect = (task, stats)
+        return None
+
+    async def op_stop_effect(self, op):
+        """Stop the effect; returns its statistics, or None if none was started."""
+        return await self._stop_effect()
+
+    async def op_measure_fps(self, op):
+        import effects
+        await self._stop_effect()
+        return await self.lights.run(effects.measure_max_fps, timeout=None)
+
+    async def _stop_effect(self):
+        if self._effect is None:
+            return None
+        task, stats = self._effect
+        self._effect = None
+        task.cancel()
+        await asyncio.wait([task])
+        return str(stats)
+
+    async def op_get_power_mode(self, op):
+        import power
+        self._require_acpi()
+        return await self.acpi.run(power.get_power_mode, self.power_modes)
+
+    async def op_set_power_mode(self, op, mode):
+        self._require_acpi()
+        if mode not in self.power_modes:
+            raise ValueError("Unknown power mode {}".format(mode))
+        writes = await self.devices.run("acpi", self.power_state.apply, mode)
+        if writes:
+            self._power_mode_switched(mode)
+        return [write[0] for write in writes]
+
+    async def op_set_fan_boost(self, op, fan, boost):
+        import power
+        self._require_acpi()
+        if fan not in ("fan1", "fan2") or not 0 <= boost <= 0xff:
+            raise ValueError("Bad fan boost {} {}".format(fan, boost))
+        return list(await self.acpi.run(power.set_fan_boost, fan, boost))
+
+    async def op_write_fan_boost(self, op, fan, boost):
+        """Set a fan boost without reading it back, for fan curves."""
+        self._require_acpi()
+        if fan not in ("fan1", "fan2") or not 0 <= boost <= 0xff:
+            raise ValueError("Bad fan boost {} {}".format(fan, boost))
+        await self.acpi.call("set_{}_boost".format(fan), "0x{:02X}".format(boost))
+        return None
+
+    async def op_read(self, op, keys):
+        from acpi import CACHE_TTL
+        unknown = [key for key in keys if key not in CACHE_TTL]
+        if unknown:
+            raise ValueError("Not a sensor or state read: {}".format(", ".join(unknown)))
+        return await self._read_sensors(keys)
+
+    async def op_get_power_source(self, op):
+        """The current source ("ac" or "battery", None if not watched) and the stored profiles."""
+        self._require_acpi()
+        return {
+            "source": self.watcher.source if self.watcher is not None else None,
+            "profiles": dict(self.profiles.profiles),
+        }
+
+    async def op_set_source_profile(self, op, source, power_mode=None, fan1=None, fan2=None):
+        """Store what to switch to on source; all None clears it. Applied on the next change."""
+        self._require_acpi()
+        if source not in SOURCES:
+            raise ValueError("Unknown power source {}".format(source))
+        if power_mode is not None and power_mode not in self.power_modes:
+            raise ValueError("Unknown power mode {}".format(power_mode))
+        for boost in (fan1, fan2):
+            if boost is not None and not 0 <= boost <= 0xff:
+                raise ValueError("Bad fan boost {}".format(boost))
+        self.profiles.set(source, power_mode, fan1, fan2)
+        return None
+
+
+def _render_frame(elc, engine, t):
+    engine.elc = elc    # The session may have reopened the device since the last frame
+    return engine.render(t)
+
+
+def _log_effect_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Effect stopped", exc_info=task.exception())
+
+
+async def serve(path=None):
+    # Stop cleanly, removing the socket, on SIGTERM and SIGINT
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, task.cancel)
+    daemon = Daemon(path)
+    await daemon.start()
+    await daemon.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dell G Series Controller daemon")
+    parser.add_argument("--socket", help="socket path (default: in $XDG_RUNTIME_DIR)")
+    args = parser.parse_args()
+    logger.info("Logging to %s", log.setup(os.path.join(state_dir(), "daemon.log")))
+    try:
+        asyncio.run(serve(args.socket))
+    except (DaemonRunning, PermissionError) as err:
+        print(err, file=sys.stderr)
+        return 1
+    except asyncio.CancelledError:
+        pass
+    finally:
+        log.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""Host-driven lighting effects.
+
+An effect is a callable effect(t, position, count) -> (red, green, blue),
+giving the color of zone number position (of count zones) at t seconds.
+EffectsEngine renders frames at a target rate and pushes them to the
+controller with Elc.set_color.
+"""
+import math
+import time
+import random
+import colorsys
+
+ZONES = [0, 1, 2, 3]
+
+
+def wave(period=3.0):
+    """Rainbow moving across the zones."""
+    def effect(t, position, count):
+        hue = (t / period + position / count) % 1.0
+        return tuple(int(c * 255) for c in colorsys.hsv_to_rgb(hue, 1.0, 1.0))
+    return effect
+
+
+def breathing(red=255, green=255, blue=255, period=4.0):
+    """All zones fading in and out together."""
+    def effect(t, position, count):
+        level = (1 - math.cos(2 * math.pi * t / period)) / 2
+        return (int(red * level), int(green * level), int(blue * level))
+    return effect
+
+
+class _Fire:
+    def __init__(self, smoothing):
+        self.smoothing = smoothing
+        self.heat = {}
+
+    def __call__(self, t, position, count):
+        heat = self.heat.get(position, 0.5)
+        heat = heat * self.smoothing + random.random() * (1 - self.smoothing)
+        self.heat[position] = heat
+        return (int(155 + 100 * heat), int(90 * heat * heat), 0)
+
+
+def fire(smoothing=0.6):
+    """Independent red/orange flicker on each zone."""
+    return _Fire(smoothing)
+
+
+EFFECTS = {"wave": wave, "breathing": breathing, "fire": fire}
+
+
+def create(name, color=None):
+    """The effect called name; color sets the breathing color."""
+    if name not in EFFECTS:
+        raise ValueError("Unknown effect {}, choose from: {}".format(name, ", ".join(EFFECTS)))
+    if name == "breathing" and color:
+        return breathing(*color)
+    return EFFECTS[name]()
+
+
+class EffectStats:
+    def __init__(self):
+        self.frames = 0
+        self.dropped = 0
+        self.reports = 0
+        self.elapsed = 0.0
+
+    @property
+    def fps(self):
+        return self.frames / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return "{} frames in {:.1f} s ({:.1f} fps), {} dropped, {} reports".format(
+            self.frames, self.elapsed, self.fps, self.dropped, self.reports)
+
+
+class EffectsEngine:
+    """Pushes frames of an effect to the controller at a fixed rate.
+
+    Frames are scheduled on the monotonic clock. When sending a frame takes
+    longer than the frame period, the missed frame slots are dropped rather
+    than sent late. A frame only sends the zones whose color changed, one
+    set_color per distinct color, in a single transaction.
+    """
+
+    def __init__(self, elc, effect, zones=ZONES, fps=30):
+        self.elc = elc
+        self.effect = effect
+        self.zones = zones
+        self.fps = fps
+        self._colors = {}
+
+    def render(self, t):
+        """Send the frame for time t; returns the number of reports sent."""
+        count = len(self.zones)
+        changed = {}
+        for position, zone in enumerate(self.zones):
+            color = self.effect(t, position, count)
+            if self._colors.get(zone) != color:
+                self._colors[zone] = color
+                changed.setdefault(color, []).append(zone)
+        if changed:
+            with self.elc.transaction():
+                for color, zones in changed.items():
+                    self.elc.set_color(zones, *color)
+        return len(changed)
+
+    def _catch_up(self, stats, deadline, now, period):
+        """Drop the frame slots already missed at now; returns the current slot's deadline."""
+        late = int((now - deadline) / period)
+        if late > 0:
+            stats.dropped += late
+            deadline += late * period
+        return deadline
+
+    def run(self, duration=None, stop=None):
+        """Play until duration seconds have passed or the stop event is set."""
+        stats = EffectStats()
+        period = 1.0 / self.fps
+        start = time.monotonic()
+        deadline = start
+        while stop is None or not stop.is_set():
+            now = time.monotonic()
+            if duration is not None and now - start >= duration:
+                break
+            deadline = self._catch_up(stats, deadline, now, period)
+            stats.reports += self.render(now - start)
+            stats.frames += 1
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        stats.elapsed = time.monotonic() - start
+        return stats
+
+    async def play(self, render, duration=None, stats=None):
+        """Like run, as a coroutine that ends when cancelled.
+
+        Each frame is sent by awaiting render(t), e.g. on the usb lane, so
+        other commands to the controller can run between frames. Pass stats
+        to read them after cancelling.
+        """
+        import asyncio
+        stats = stats or EffectStats()
+        period = 1.0 / self.fps
+        start = time.monotonic()
+        deadline = start
+        try:
+            while True:
+                now = time.monotonic()
+                if duration is not None and now - start >= duration:
+                    break
+                deadline = self._catch_up(stats, deadline, now, period)
+                stats.reports += await render(now - start)
+                stats.frames += 1
+                deadline += period
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        finally:
+            stats.elapsed = time.monotonic() - start
+        return stats
+
+
+def measure_max_fps(elc, zones=ZONES, duration=2.0):
+    """Send full frames back to back and return the frame rate achieved.
+
+    Every zone gets a different color on every frame, so this is the worst
+    case of what EffectsEngine can push.
+    """
+    frames = 0
+    start = time.monotonic()
+    while time.monotonic() - start < duration:
+        with elc.transaction():
+            for position, zone in enumerate(zones):
+                elc.set_color([zone], frames & 0xff, position, 0)
+        frames += 1
+    return frames / (time.monotonic() - start)
@@ -6,6 +6,21 @@ import struct
 from elc_constants import *
 from hidreport import *
 import binascii
+import contextlib
+
+REPORT_ID=0x03
+REPORT_LENGTH=33
+EMPTY_REPORT=bytes(REPORT_LENGTH)
+
+# Report layouts, starting with the report id byte. Zone lists follow the
+# fixed part, one byte per zone.
+QUERY_REPORT=struct.Struct('>BBB')		# id, ELC_QUERY, subcommand
+ANIMATION_REPORT=struct.Struct('>BBHH')	# id, command, subcommand, animation
+SERIES_REPORT=struct.Struct('>BBBH')	# id, START_SERIES, loop, zone count
+ACTION_HEADER=struct.Struct('>BB')		# id, ADD_ACTION
+ACTION=struct.Struct('>BHHBBB')			# effect, duration, tempo, red, green, blue
+DIMMING_REPORT=struct.Struct('>BBBH')	# id, DIMMING, level, zone count
+COLOR_REPORT=struct.Struct('>BBBBBH')	# id, SET_COLOR, red, green, blue, zone count
 
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
@@ -19,145 +34,219 @@ class Action:
 		self.green = green
 		self.blue = blue
 
-	def __str__(self):
-		fragment=format(self.effect,'02x')
-		fragment+=format(self.duration,'04x')
-		fragment+=format(self.tempo,'04x')
-		fragment+=format(self.red,'02x')
-		fragment+=format(self.green,'02x')
-		fragment+=format(self.blue,'02x')
-		return fragment
+	def pack_into(self,buffer,offset):
+		ACTION.pack_into(buffer,offset,self.effect,self.duration,self.tempo,self.red,self.green,self.blue)
 
 class Elc:
 
-	def build_command(self,fragment) :
-		bytes=bytearray.fromhex(fragment)
-		bytes+=bytearray.fromhex('00' * (33-len(bytes)))
-		return bytes
+	# Binary encoders. They all write into the same preallocated report
+	# buffer, which is only valid until the next encode.
+	def encode_query(self,subcommand) :
+		report=self._report
+		report[:]=EMPTY_REPORT
+		QUERY_REPORT.pack_into(report,0,REPORT_ID,ELC_QUERY,subcommand)
+		return report
+
+	def encode_animation(self,subcommand,animation) :
+		if (animation < 0x5b or animation > 0x60):
+			command=USER_ANIMATION
+		else:
+			command=POWER_ANIMATION
+		report=self._report
+		report[:]=EMPTY_REPORT
+		ANIMATION_REPORT.pack_into(report,0,REPORT_ID,command,subcommand,animation)
+		return report
+
+	def encode_series(self,zones,loop=1) :
+		report=self._report
+		report[:]=EMPTY_REPORT
+		SERIES_REPORT.pack_into(report,0,REPORT_ID,START_SERIES,loop,len(zones))
+		self._pack_zones(SERIES_REPORT.size,zones)
+		return report
+
+	def encode_actions(self,actions) :
+		if len(actions) > 3 :
+			raise Exception("Too many actions in a single start action")
+		report=self._report
+		report[:]=EMPTY_REPORT
+		ACTION_HEADER.pack_into(report,0,REPORT_ID,ADD_ACTION)
+		offset=ACTION_HEADER.size
+		for k in actions:
+			k.pack_into(report,offset)
+			offset+=ACTION.size
+		return report
+
+	def encode_dim(self,zones,dimming) :
+		report=self._report
+		report[:]=EMPTY_REPORT
+		DIMMING_REPORT.pack_into(report,0,REPORT_ID,DIMMING,dimming,len(zones))
+		self._pack_zones(DIMMING_REPORT.size,zones)
+		return report
+
+	def encode_color(self,zones,red,green,blue) :
+		report=self._report
+		report[:]=EMPTY_REPORT
+		COLOR_REPORT.pack_into(report,0,REPORT_ID,SET_COLOR,red,green,blue,len(zones))
+		self._pack_zones(COLOR_REPORT.size,zones)
+		return report
+
+	def _pack_zones(self,offset,zones) :
+		report=self._report
+		for zone in zones:
+			report[offset]=zone
+			offset+=1
+
+	def send_report(self,report) :
+		if self._queue is not None:
+			self._queue.append(bytes(report))
+			return None
+		hid_set_output_report(self.device,report)
+		return bytearray(hid_get_input_report(self.device,REPORT_LENGTH))
+
+	def query(self,report) :
+		if self._recording:
+			raise Exception("Queries cannot be recorded")
+		# Queries always need their reply, so anything queued goes out first.
+		if self._queue:
+			self._send_queued()
+		hid_set_output_report(self.device,report)
+		self._unacknowledged=0
+		return bytearray(hid_get_input_report(self.device,REPORT_LENGTH))
+
+	@contextlib.contextmanager
+	def transaction(self) :
+		"""Queue commands and send them back-to-back on exit.
 
-	def run_command(self,device,fragment) :
-		bytes=self.build_command('03' + fragment)
-		hid_set_output_report(device,bytes)
-		return bytearray(hid_get_input_report(device,33))
+		Only the final report is followed by a status read, which raises if
+		the controller did not accept that report. Commands return
+		None inside a transaction, and queued commands are dropped if the block
+		raises.
+		Nested transactions join the outermost one.
+		"""
+		if self._queue is not None:
+			yield self
+			return
+		self._queue=[]
+		try:
+			yield self
+			self._commit()
+		except BaseException:
+			self._on_commit.clear()
+			raise
+		finally:
+			self._queue=None
+		callbacks=self._on_commit[:]
+		self._on_commit.clear()
+		for callback in callbacks:
+			callback()
+
+	def _commit(self) :
+		self._send_queued()
+		if self._unacknowledged:
+			self._unacknowledged=0
+			reply=bytearray(hid_get_input_report(self.device,REPORT_LENGTH))
+			if (self.debug==1): eprint(binascii.hexlify(reply))
+			if len(reply)!=REPORT_LENGTH:
+				raise Exception("ELC did not acknowledge the transaction")
+			# An accepted command is answered with its report id and command
+			if reply[0:2]!=self._last_report[0:2]:
+				raise Exception("ELC rejected the transaction: {}".format(binascii.hexlify(reply).decode()))
+
+	def on_commit(self,callback) :
+		"""Call callback once the current transaction has been acknowledged."""
+		if self._queue is None:
+			callback()
+		else:
+			self._on_commit.append(callback)
+
+	@contextlib.contextmanager
+	def recording(self) :
+		"""Collect the reports of the enclosed commands instead of sending them."""
+		queue,self._queue=self._queue,[]
+		reports=self._queue
+		self._recording+=1
+		try:
+			yield reports
+		finally:
+			self._recording-=1
+			self._queue=queue
+
+	def _send_queued(self) :
+		queue=self._queue
+		for report in queue:
+			hid_set_output_report(self.device,report)
+		if queue:
+			self._last_report=queue[-1]
+		self._unacknowledged+=len(queue)
+		queue.clear()
+
+	def _command(self,report) :
+		reply=self.send_report(report)
+		if (self.debug==1 and reply is not None): eprint(binascii.hexlify(reply))
+		return reply
 
 	def get_version(self) :
-		reply=self.run_command(self.device,format(ELC_QUERY,'02x') + format(GET_VERSION,'02x'))
+		reply=self.query(self.encode_query(GET_VERSION))
 		return (reply[3],reply[4],reply[5])
 
 	def get_status(self) :
 		return 0
 
 	def get_platform(self) :
-		reply=self.run_command(self.device,format(ELC_QUERY,'02x') + format(GET_PLATFORM,'02x'))
+		reply=self.query(self.encode_query(GET_PLATFORM))
 		return (reply[3:5],reply[5])
 
+	def get_animation_by_id(self,animation) :
+		"""Return the (id, duration) the firmware reports for an animation slot.
+
+		An id of 0 means the slot is empty.
+		"""
+		report=self.encode_query(GET_ANIMATION_BY_ID)
+		struct.pack_into('>H',report,QUERY_REPORT.size,animation)
+		reply=self.query(report)
+		return (struct.unpack('>H',reply[3:5])[0],struct.unpack('>H',reply[5:7])[0])
+
 	def get_animation_count(self) :
-		reply=self.run_command(self.device,format(ELC_QUERY,'02x') + format(GET_ANIMATION_COUNT,'02x'))
+		reply=self.query(self.encode_query(GET_ANIMATION_COUNT))
 		return (struct.unpack('>H',reply[3:5])[0],struct.unpack('>H',reply[5:7])[0])
 
 	def start_new_animation(self,animation, duration=0) :
-		if (animation < 0x5b or animation > 0x60):
-			command=USER_ANIMATION
-		else:
-			command=POWER_ANIMATION
-		command=format(command,'02x')
-		reply=self.run_command(self.device,command+format(START_NEW,'04x')+format(animation,"04x"))
-		if (self.debug==1): eprint(binascii.hexlify(reply))
-		return reply
+		return self._command(self.encode_animation(START_NEW,animation))
 
 	def finish_save_animation(self,animation, duration=0) :
-		if (animation < 0x5b or animation > 0x60):
-			command=USER_ANIMATION
-		else:
-			command=POWER_ANIMATION
-		command=format(command,'02x')
-		reply=self.run_command(self.device,command+format(FINISH_SAVE,'04x')+format(animation,"04x"))
-		if (self.debug==1): eprint(binascii.hexlify(reply))
-		return reply
+		return self._command(self.encode_animation(FINISH_SAVE,animation))
 
 	def finish_play_animation(self,animation, duration=0) :
-		if (animation < 0x5b or animation > 0x60):
-			command=USER_ANIMATION
-		else:
-			command=POWER_ANIMATION
-		command=format(command,'02x')
-		reply=self.run_command(self.device,command+format(FINISH_PLAY,'04x')+format(animation,"04x"))
-		if (self.debug==1): eprint(binascii.hexlify(reply))
-		return reply
-		
+		return self._command(self.encode_animation(FINISH_PLAY,animation))
 
 	def remove_animation(self,animation, duration=0) :
-		if (animation < 0x5b or animation > 0x60):
-			command=USER_ANIMATION
-		else:
-			command=POWER_ANIMATION
-		command=format(command,'02x')
-		reply=self.run_command(self.device,command+format(REMOVE,'04x')+format(animation,"04x"))
-		if (self.debug==1): eprint(binascii.hexlify(reply))
-		return reply
+		return self._command(self.encode_animation(REMOVE,animation))
 
 	def play_animation(self,animation, duration=0) :
-		if (animation < 0x5b or animation > 0x60):
-			command=USER_ANIMATION
-		else:
-			command=POWER_ANIMATION
-		command=format(command,'02x')
-		reply=self.run_command(self.device,command+format(PLAY,'04x')+format(animation,"04x"))
-		if (self.debug==1): eprint(binascii.hexlify(reply))
-		return reply
+		return self._command(self.encode_animation(PLAY,animation))
 
 	def set_default_animation(self,animation, duration=0) :
-		if (animation < 0x5b or animation > 0x60):
-			command=USER_ANIMATION
-		else:
-			command=POWER_ANIMATION
-		command=format(command,'02x')
-		reply=self.run_command(self.device,command+format(SET_DEFAULT,'04x')+format(animation,"04x"))
-		if (self.debug==1): eprint(binascii.hexlify(reply))
-		return reply
+		return self._command(self.encode_animation(SET_DEFAULT,animation))
 
 	def set_startup_animation(self,animation, duration=0) :
-		if (animation < 0x5b or animation > 0x60):
-			command=USER_ANIMATION
-		else:
-			command=POWER_ANIMATION
-		command=format(command,'02x')
-		reply=self.run_command(self.device,command+format(SET_DEFAULT,'04x')+format(animation,"04x"))
-		if (self.debug==1): eprint(binascii.hexlify(reply))
-		return reply
+		return self._command(self.encode_animation(SET_STARTUP,animation))
 
 	def start_series(self,zones, loop=1) :
-		zonestring="".join(format(x,"02x") for x in zones)
-		reply=self.run_command(self.device,format(START_SERIES,'02x')+format(loop,"02x")+format(len(zones),"04x")+zonestring)
-		if (self.debug==1): eprint(binascii.hexlify(reply))
-		return reply
+		return self._command(self.encode_series(zones,loop))
 
 	def add_action(self,actions) :
-		fragment=format(ADD_ACTION,'02x')
-		if len(actions) > 3 :
-			raise Exception("Too many actions in a single start action")
-		for k in actions:
-			fragment += str(k)
-		reply=self.run_command(self.device,fragment)
-		if (self.debug==1): eprint(binascii.hexlify(reply))
-		return reply
+		return self._command(self.encode_actions(actions))
 
 	def set_event(self):
 		raise Exception("Not implemented on device")
 
 	def dim(self,zones,dimming):
-		zonestring="".join(format(x,'02x') for x in zones)
-		fragment=format(DIMMING,'02x')+format(dimming,'02x')+format(len(zones),'04x')+zonestring
-		reply=self.run_command(self.device,fragment)
-		if (self.debug==1): eprint(binascii.hexlify(reply))
-		return reply
+		return self._command(self.encode_dim(zones,dimming))
 
 	def set_color(self,zones,red,green,blue):
-		zonestring="".join(format(x,'02x') for x in zones)
-		fragment=format(SET_COLOR,'02x')+format(red,'02x')+format(green,'02x')+format(blue,'02x')+format(len(zones),'04x')+zonestring
-		reply=self.run_command(self.device,fragment)
-		if (self.debug==1): eprint(binascii.hexlify(reply))
-		return reply
+		# Shown instead of the animation until one is played again
+		self.direct_colors=True
+		return self._command(self.encode_color(zones,red,green,blue))
 
 	def reset(self):
 		raise Exception("Not implemented in this code at this time")
@@ -165,9 +254,18 @@ class Elc:
 	def spi_flash(self):
 		raise Exception("Not implemented in this code at this time")
 
-	def __init__(self,vid,pid,debug=0):
-		self.device=usb.core.find(idVendor=vid, idProduct=pid)
+	def __init__(self,vid,pid,debug=0,device=None):
+		if device is None:
+			device=usb.core.find(idVendor=vid, idProduct=pid)
+		self.device=device
 		self.debug=debug
+		self._report=bytearray(REPORT_LENGTH)
+		self._queue=None
+		self._unacknowledged=0
+		self._last_report=EMPTY_REPORT
+		self._recording=0
+		self._on_commit=[]
+		self.direct_colors=False
 		
 
 def main():
@@ -175,7 +273,7 @@ def main():
 	vid=int(sys.argv[1],16)
 	pid=int(sys.argv[2],16)
 	elc=Elc(vid,pid)
-	(major,minor,revision) = elc.query_version()
+	(major,minor,revision) = elc.get_version()
 	print("Firmware: %d.%d.%d" % (major,minor,revision))
 	return 0
 
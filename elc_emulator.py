@@ -0,0 +1,283 @@
+#!/usr/bin/python3
+"""In-process emulator of the ELC lighting controller.
+
+ElcEmulator stands in for the USB device: it has the ctrl_transfer and
+idProduct attributes hidreport and awelc use, so it can be passed as
+Elc(..., device=ElcEmulator()) or ElcSession(device=ElcEmulator()). It keeps
+the controller state the commands in elc_constants act on, and answers the
+queries from it, so command sequences can be checked and counted offline.
+
+The firmware's reply to a command other than a query is not documented; the
+emulator echoes the report id, command and subcommand of the request, and
+answers a command it rejects with an empty report.
+"""
+import struct
+
+from elc_constants import *
+
+REPORT_LENGTH = 33
+REPORT_ID = 0x03
+
+SET_REPORT = 9
+GET_REPORT = 1
+
+POWER_ANIMATIONS = range(AC_SLEEP, DC_LOW + 1)
+
+COMMAND_NAMES = {
+    ELC_QUERY: "ELC_QUERY",
+    USER_ANIMATION: "USER_ANIMATION",
+    POWER_ANIMATION: "POWER_ANIMATION",
+    START_SERIES: "START_SERIES",
+    ADD_ACTION: "ADD_ACTION",
+    SET_EVENT: "SET_EVENT",
+    DIMMING: "DIMMING",
+    SET_COLOR: "SET_COLOR",
+    RESET: "RESET",
+    SPI_FLASH: "SPI_FLASH",
+}
+
+
+class ElcProtocolError(Exception):
+    pass
+
+
+class Series:
+    def __init__(self, zones, loop):
+        self.zones = zones
+        self.loop = loop
+        self.actions = []
+
+    def key(self):
+        return (self.zones, self.loop, tuple(self.actions))
+
+    def __repr__(self):
+        return "Series(zones={}, loop={}, actions={})".format(list(self.zones), self.loop, self.actions)
+
+
+class Animation:
+    def __init__(self, animation):
+        self.animation = animation
+        self.series = []
+
+    @property
+    def duration(self):
+        """Length of one pass: the longest series' total action duration."""
+        return min(0xffff, max((sum(action[1] for action in series.actions) for series in self.series), default=0))
+
+    def key(self):
+        return tuple(series.key() for series in self.series)
+
+    def __repr__(self):
+        return "Animation(0x{:04x}, {})".format(self.animation, self.series)
+
+
+class ElcEmulator:
+    """State machine of the controller behind a fake control endpoint.
+
+    Protocol errors (an action outside a series, a power animation id sent
+    as a user animation, ...) are appended to errors, or raised as
+    ElcProtocolError when strict is set. With trace set, every decoded
+    command is appended to log.
+    """
+
+    def __init__(self, product=0x0550, version=(1, 0, 0), platform=0, strict=False, trace=False):
+        self.idProduct = product
+        self.version = version
+        self.platform = platform
+        self.strict = strict
+        self.trace = trace
+        self.reports = 0
+        self.reads = 0
+        self.errors = []
+        self.log = []
+        self._reply = bytearray(REPORT_LENGTH)
+        self.power_on()
+
+    def power_on(self):
+        """Reset the volatile state, as after a reboot. Saved animations are kept."""
+        if not hasattr(self, "animations"):
+            self.animations = {}
+            self.default = None
+            self.startup = None
+        self.building = None
+        self.series = None
+        self.playing = self.default
+        self.dimming = {}
+        self.colors = {}
+
+    @property
+    def transfers(self):
+        return self.reports + self.reads
+
+    def snapshot(self):
+        """The persistent state, comparable between two command sequences."""
+        return {
+            "animations": {animation: self.animations[animation].key() for animation in sorted(self.animations)},
+            "default": self.default,
+            "startup": self.startup,
+            "dimming": dict(sorted(self.dimming.items())),
+        }
+
+    # USB side
+
+    def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0, data_or_length=None, timeout=None):
+        if bmRequestType & 0x80:
+            if bRequest != GET_REPORT:
+                raise ElcProtocolError("Unsupported IN request {}".format(bRequest))
+            self.reads += 1
+            return bytes(self._reply[:data_or_length])
+        if bRequest != SET_REPORT:
+            raise ElcProtocolError("Unsupported OUT request {}".format(bRequest))
+        self.reports += 1
+        report = bytes(data_or_length)
+        self.handle(report)
+        return len(report)
+
+    def handle(self, report):
+        if len(report) != REPORT_LENGTH or report[0] != REPORT_ID:
+            self._error("Malformed report {}".format(report.hex()))
+            return
+        command = report[1]
+        reply = self._reply
+        reply[:] = bytes(REPORT_LENGTH)
+        reply[0:3] = report[0:3]
+        handler = self._handlers.get(command)
+        if handler is None:
+            self._error("Unsupported command 0x{:02x}".format(command))
+            return
+        handler(self, report, reply)
+
+    def _error(self, message):
+        if self.strict:
+            raise ElcProtocolError(message)
+        self.errors.append(message)
+        self._reply[:] = bytes(REPORT_LENGTH)
+
+    def _trace(self, *entry):
+        if self.trace:
+            self.log.append(entry)
+
+    # Commands
+
+    def _query(self, report, reply):
+        subcommand = report[2]
+        self._trace("ELC_QUERY", subcommand)
+        if subcommand == GET_VERSION:
+            reply[3:6] = bytes(self.version)
+        elif subcommand == GET_STATUS:
+            pass
+        elif subcommand == GET_PLATFORM:
+            struct.pack_into('>HB', reply, 3, self.platform, 0)
+        elif subcommand == GET_ANIMATION_COUNT:
+            last = next(reversed(self.animations), 0)
+            struct.pack_into('>HH', reply, 3, len(self.animations), last)
+        elif subcommand == GET_ANIMATION_BY_ID:
+            animation = struct.unpack_from('>H', report, 3)[0]
+            stored = self.animations.get(animation)
+            if stored is not None:
+                struct.pack_into('>HH', reply, 3, animation, stored.duration)
+        else:
+            self._error("Unsupported query 0x{:02x}".format(subcommand))
+
+    def _animation(self, report, reply):
+        command = report[1]
+        subcommand, animation = struct.unpack_from('>HH', report, 2)
+        self._trace(COMMAND_NAMES[command], subcommand, animation)
+        if (command == POWER_ANIMATION) != (animation in POWER_ANIMATIONS):
+            self._error("Animation 0x{:04x} sent as {}".format(animation, COMMAND_NAMES[command]))
+        if subcommand == START_NEW:
+            if self.building is not None:
+                self._error("Animation 0x{:04x} started while 0x{:04x} is open".format(animation, self.building.animation))
+            self.building = Animation(animation)
+            self.series = None
+        elif subcommand in (FINISH_SAVE, FINISH_PLAY):
+            building = self.building
+            if building is None or building.animation != animation:
+                self._error("Animation 0x{:04x} finished without being started".format(animation))
+                return
+            self.building = None
+            self.series = None
+            if subcommand == FINISH_SAVE:
+                self.animations.pop(animation, None)
+                self.animations[animation] = building
+            else:
+                self.playing = animation
+        elif subcommand == REMOVE:
+            self.animations.pop(animation, None)
+            if self.default == animation:
+                self.default = None
+            if self.startup == animation:
+                self.startup = None
+        elif subcommand in (PLAY, SET_DEFAULT, SET_STARTUP):
+            if animation not in self.animations:
+                self._error("Animation 0x{:04x} is not stored".format(animation))
+                return
+            if subcommand == PLAY:
+                self.playing = animation
+            elif subcommand == SET_DEFAULT:
+                self.default = animation
+            else:
+                self.startup = animation
+        else:
+            self._error("Unsupported animation subcommand 0x{:04x}".format(subcommand))
+
+    def _start_series(self, report, reply):
+        loop, count = struct.unpack_from('>BH', report, 2)
+        zones = self._zones(report, 5, count)
+        self._trace("START_SERIES", loop, zones)
+        if self.building is None:
+            self._error("Series started outside an animation")
+            return
+        self.series = Series(zones, loop)
+        self.building.series.append(self.series)
+
+    def _add_action(self, report, reply):
+        actions = []
+        for offset in range(2, 2 + 3 * 8, 8):
+            action = struct.unpack_from('>BHHBBB', report, offset)
+            if not any(action):
+                break
+            actions.append(action)
+        self._trace("ADD_ACTION", actions)
+        if self.series is None:
+            self._error("Action added outside a series")
+            return
+        self.series.actions.extend(actions)
+
+    def _dim(self, report, reply):
+        level, count = struct.unpack_from('>BH', report, 2)
+        zones = self._zones(report, 5, count)
+        self._trace("DIMMING", level, zones)
+        if level > 100:
+            self._error("Dimming level {} out of range".format(level))
+        for zone in zones:
+            self.dimming[zone] = level
+
+    def _set_color(self, report, reply):
+        red, green, blue, count = struct.unpack_from('>BBBH', report, 2)
+        zones = self._zones(report, 7, count)
+        self._trace("SET_COLOR", (red, green, blue), zones)
+        for zone in zones:
+            self.colors[zone] = (red, green, blue)
+
+    def _zones(self, report, offset, count):
+        if offset + count > REPORT_LENGTH:
+            self._error("Zone count {} overflows the report".format(count))
+            count = REPORT_LENGTH - offset
+        return tuple(report[offset:offset + count])
+
+    def _not_implemented(self, report, reply):
+        self._error("{} is not implemented".format(COMMAND_NAMES[report[1]]))
+
+    _handlers = {
+        ELC_QUERY: _query,
+        USER_ANIMATION: _animation,
+        POWER_ANIMATION: _animation,
+        START_SERIES: _start_series,
+        ADD_ACTION: _add_action,
+        DIMMING: _dim,
+        SET_COLOR: _set_color,
+        SET_EVENT: _not_implemented,
+        RESET: _not_implemented,
+        SPI_FLASH: _not_implemented,
+    }
@@ -0,0 +1,143 @@
+import time
+import bisect
+
+from telemetry import SENSORS
+
+BOOST_MAX = 0xff
+
+DEFAULT_CURVES = {
+    "fan1": "50:0,65:64,80:160,90:255",
+    "fan2": "50:0,65:64,80:160,90:255",
+}
+
+
+class FanCurve:
+    """Piecewise linear map from temperature (°C) to fan boost (0-255)."""
+
+    def __init__(self, points):
+        if not points:
+            raise ValueError("A fan curve needs at least one point")
+        points = sorted(points)
+        self._temps = [temp for temp, boost in points]
+        self._boosts = [max(0, min(boost, BOOST_MAX)) for temp, boost in points]
+
+    @classmethod
+    def parse(cls, text):
+        """Build a curve from "temp:boost,temp:boost,..." text."""
+        points = []
+        for point in text.split(","):
+            temp, boost = point.split(":")
+            points.append((float(temp), int(boost, 0)))
+        return cls(points)
+
+    def __str__(self):
+        return ",".join("{:g}:{}".format(temp, boost) for temp, boost in zip(self._temps, self._boosts))
+
+    def boost(self, temp):
+        i = bisect.bisect_right(self._temps, temp)
+        if i == 0:
+            return self._boosts[0]
+        if i == len(self._temps):
+            return self._boosts[-1]
+        t0, t1 = self._temps[i - 1], self._temps[i]
+        b0, b1 = self._boosts[i - 1], self._boosts[i]
+        return round(b0 + (b1 - b0) * (temp - t0) / (t1 - t0))
+
+
+class FanController:
+    """Turns temperature readings into boost writes for one fan.
+
+    The temperature only counts as falling once it is hysteresis degrees
+    below its last peak, the boost moves at most rate units per second, and
+    a write is only asked for once it is at least step away from the last
+    one written, or once the boost has settled on the curve.
+    """
+
+    def __init__(self, curve, sensor, write_key, hysteresis=3, rate=64, step=16):
+        self.curve = curve
+        self.sensor = sensor
+        self.write_key = write_key
+        self.hysteresis = hysteresis
+        self.rate = rate
+        self.step = step
+        self.reset()
+
+    def reset(self):
+        self._temp = None
+        self._boost = None
+        self._time = None
+        self.written = None
+
+    def update(self, temp, now):
+        """Feed a reading; return the boost to write, or None to leave it."""
+        if self._temp is None or temp > self._temp:
+            self._temp = temp
+        elif temp < self._temp - self.hysteresis:
+            self._temp = temp + self.hysteresis
+        target = self.curve.boost(self._temp)
+
+        if self._boost is None:
+            boost = target
+        else:
+            limit = self.rate * (now - self._time)
+            boost = max(self._boost - limit, min(target, self._boost + limit))
+        self._boost = boost
+        self._time = now
+
+        boost = round(boost)
+        if boost == self.written:
+            return None
+        if self.written is not None and abs(boost - self.written) < self.step and boost != target:
+            return None
+        self.written = boost
+        return boost
+
+
+class FanCurveEngine:
+    """Drives fan controllers from telemetry.
+
+    While started it subscribes to the controllers' temperature sensors,
+    reading them every interval seconds while they move, and calls
+    write(acpi call name, boost) for each boost change. It keeps running
+    while the window is hidden.
+    """
+
+    def __init__(self, controllers, write, interval=0.5, max_interval=4.0):
+        self.controllers = controllers
+        self.write = write
+        self.interval = interval
+        self.max_interval = max_interval
+        self.scheduler = None
+
+    def start(self, scheduler):
+        self.scheduler = scheduler
+        for controller in self.controllers:
+            controller.reset()
+            scheduler.configure(controller.sensor, self.interval, self.max_interval,
+                                SENSORS[controller.sensor][2])
+        scheduler.subscribe(self.update, [controller.sensor for controller in self.controllers])
+
+    def stop(self):
+        if self.scheduler is None:
+            return
+        self.scheduler.unsubscribe(self.update)
+        for controller in self.controllers:
+            self.scheduler.configure(controller.sensor, *SENSORS[controller.sensor])
+        self.scheduler = None
+
+    def reset(self):
+        """Forget the boosts written, after something else (a power mode switch) reset them."""
+        for controller in self.controllers:
+            controller.reset()
+
+    @property
+    def running(self):
+        return self.scheduler is not None
+
+    def update(self, values):
+        now = time.monotonic()
+        for controller in self.controllers:
+            if controller.sensor in values:
+                boost = controller.update(values[controller.sensor], now)
+                if boost is not None:
+                    self.write(controller.write_key, boost)
@@ -0,0 +1,65 @@
+import time
+from PySide6.QtCore import Qt, QPointF
+from PySide6.QtGui import QPainter, QPen, QColor, QPolygonF
+from PySide6.QtWidgets import QWidget
+
+
+class TelemetryGraph(QWidget):
+    """Plots sensors of a TelemetryHistory over the last span seconds.
+
+    Points are taken straight from the history's ring buffers on each paint.
+    lines is a list of (sensor key, label, color) tuples sharing one y axis.
+    """
+
+    def __init__(self, history, lines, span=600, unit="°C", parent=None):
+        super().__init__(parent)
+        self.history = history
+        self.lines = lines
+        self.span = span
+        self.unit = unit
+        self.setMinimumHeight(120)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.fillRect(self.rect(), self.palette().base())
+        plot = self.rect().adjusted(4, 4, -4, -painter.fontMetrics().height() - 6)
+        now = time.monotonic()
+
+        windows = {key: self.history.window(key, self.span, now) for key, label, color in self.lines}
+        low, high = None, None
+        for key, n in windows.items():
+            if n:
+                values = self.history.series(key)[1]
+                low = values.min(n) if low is None else min(low, values.min(n))
+                high = values.max(n) if high is None else max(high, values.max(n))
+        if low is None:
+            painter.setPen(self.palette().text().color())
+            painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, "No data yet")
+            return
+        low, high = low - 5, high + 5
+        x_scale = plot.width() / self.span
+        y_scale = plot.height() / (high - low)
+
+        legend = []
+        for key, label, color in self.lines:
+            n = windows[key]
+            if not n:
+                continue
+            times, values = self.history.series(key)
+            polygon = QPolygonF()
+            for time_segment, value_segment in zip(times.segments(n), values.segments(n)):
+                for t, value in zip(time_segment, value_segment):
+                    polygon.append(QPointF(plot.right() - (now - t) * x_scale,
+                                           plot.bottom() - (value - low) * y_scale))
+            painter.setPen(QPen(QColor(color), 1.5))
+            painter.drawPolyline(polygon)
+            legend.append((color, "{} {}-{} {} (avg {:.0f})".format(
+                label, values.min(n), values.max(n), self.unit, values.mean(n))))
+
+        x = plot.left()
+        baseline = self.rect().bottom() - 4
+        for color, text in legend:
+            painter.setPen(QColor(color))
+            painter.drawText(x, baseline, text)
+            x += painter.fontMetrics().horizontalAdvance(text) + 12
@@ -0,0 +1,96 @@
+from array import array
+
+
+class RingBuffer:
+    """Fixed-capacity circular buffer backed by an array.
+
+    Appending is O(1) and memory never grows past capacity. Queries walk
+    memoryviews over the backing array, so nothing is copied.
+    """
+
+    def __init__(self, capacity, typecode='H'):
+        self._data = array(typecode, [0]) * capacity
+        self._view = memoryview(self._data)
+        self.capacity = capacity
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value):
+        self._data[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def last(self):
+        if not self._count:
+            return None
+        return self._data[self._next - 1]
+
+    def segments(self, n=None):
+        """Views over the newest n samples (all if None), oldest first.
+
+        At most two views are returned because the window may wrap around
+        the end of the backing array.
+        """
+        n = self._count if n is None else min(n, self._count)
+        if n <= 0:
+            return []
+        start = self._next - n
+        if start >= 0:
+            return [self._view[start:self._next]]
+        return [self._view[start + self.capacity:], self._view[:self._next]]
+
+    def __iter__(self):
+        for segment in self.segments():
+            yield from segment
+
+    def min(self, n=None):
+        return min(min(segment) for segment in self.segments(n))
+
+    def max(self, n=None):
+        return max(max(segment) for segment in self.segments(n))
+
+    def mean(self, n=None):
+        segments = self.segments(n)
+        return sum(sum(segment) for segment in segments) / sum(len(segment) for segment in segments)
+
+    def count_since(self, threshold):
+        """Number of newest samples that are >= threshold (for increasing data)."""
+        n = 0
+        for segment in reversed(self.segments()):
+            for value in reversed(segment):
+                if value < threshold:
+                    return n
+                n += 1
+        return n
+
+
+class TelemetryHistory:
+    """One ring buffer of values, and one of read times, per sensor.
+
+    Sensors are read at varying rates, so each keeps its own timestamps
+    (time.monotonic() seconds). Capacity is sized for the given number of
+    hours at the fastest read rate.
+    """
+
+    def __init__(self, keys, hours=4, rate=1.0):
+        capacity = int(hours * 3600 * rate)
+        self._series = {key: (RingBuffer(capacity, 'd'), RingBuffer(capacity, 'H')) for key in keys}
+
+    def record(self, values, now):
+        for key, value in values.items():
+            if key in self._series:
+                times, samples = self._series[key]
+                times.append(now)
+                samples.append(max(0, min(value, 0xffff)))
+
+    def series(self, key):
+        """Return (times, values) ring buffers for a sensor."""
+        return self._series[key]
+
+    def window(self, key, seconds, now):
+        """Number of samples of a sensor read within the last seconds."""
+        return self._series[key][0].count_since(now - seconds)
@@ -0,0 +1,114 @@
+"""Temperatures and fan speeds from /sys/class/hwmon, without root.
+
+The dell_smm, coretemp and k10temp drivers expose the same readings as the
+get_*_temp and get_*_rpm ACPI calls. HwmonSensors looks the channels up
+once, keeps their files open and reads them with os.pread; the calls are
+named like the ACPI ones so the two mix in one dict:
+
+    sensors = HwmonSensors()
+    sensors.open()
+    values = read(sensors, ["get_cpu_temp", "get_fan1_rpm"], acpi.call_batch)
+
+A sensor with no hwmon channel, or whose channel fails to read, is read
+through the fallback instead.
+"""
+import os
+import logging
+
+log = logging.getLogger("dgsc.acpi")
+
+HWMON_DIR = "/sys/class/hwmon"
+
+# (driver, channel, label, call) in order of preference; None matches any
+CHANNELS = [
+    ("dell_smm", None, "Processor Fan", "get_fan1_rpm"),
+    ("dell_smm", None, "Video Fan", "get_fan2_rpm"),
+    ("dell_smm", "fan1", None, "get_fan1_rpm"),     # Fan types not reported
+    ("dell_smm", "fan2", None, "get_fan2_rpm"),
+    ("dell_smm", None, "CPU", "get_cpu_temp"),
+    ("dell_smm", None, "GPU", "get_gpu_temp"),
+    ("coretemp", None, "Package id 0", "get_cpu_temp"),
+    ("k10temp", None, "Tctl", "get_cpu_temp"),
+]
+
+
+def _read_text(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def discover(root=HWMON_DIR):
+    """Return {call: input file} for the calls some hwmon channel answers."""
+    found = {}
+    available = []
+    for device in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        path = os.path.join(root, device)
+        driver = _read_text(os.path.join(path, "name"))
+        for entry in sorted(os.listdir(path)):
+            if entry.endswith("_input") and entry.startswith(("temp", "fan")):
+                channel = entry[:-len("_input")]
+                label = _read_text(os.path.join(path, channel + "_label"))
+                available.append((driver, channel, label, os.path.join(path, entry)))
+    for driver, channel, label, call in CHANNELS:
+        if call in found:
+            continue
+        for found_driver, found_channel, found_label, path in available:
+            if (found_driver == driver and channel in (None, found_channel)
+                    and (label is None or found_label == label)):
+                found[call] = path
+                break
+    return found
+
+
+class HwmonSensors:
+    """Reads the sensors hwmon has channels for; keys is the set of those calls."""
+
+    def __init__(self, root=HWMON_DIR):
+        self.root = root
+        self._fds = {}
+
+    @property
+    def keys(self):
+        return frozenset(self._fds)
+
+    def open(self):
+        for call, path in discover(self.root).items():
+            try:
+                self._fds[call] = os.open(path, os.O_RDONLY)
+            except OSError as err:
+                log.info("Cannot open %s: %s", path, err)
+                continue
+            log.info("Reading %s from %s", call, path)
+        return self
+
+    def read(self, calls):
+        """Return {call: value} for the calls that could be read; temperatures in °C."""
+        values = {}
+        for call in calls:
+            fd = self._fds.get(call)
+            if fd is None:
+                continue
+            try:
+                value = int(os.pread(fd, 32, 0))
+            except (OSError, ValueError) as err:
+                log.debug("Cannot read %s: %s", call, err)
+                continue
+            values[call] = value // 1000 if call.endswith("_temp") else value
+        return values
+
+    def close(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+
+def read(sensors, calls, fallback):
+    """Read calls from sensors, the rest with fallback(list), e.g. Acpi.call_batch."""
+    values = sensors.read(calls)
+    rest = [call for call in calls if call not in values]
+    if rest:
+        values.update(fallback(rest))
+    return values
@@ -0,0 +1,71 @@
+"""Logging for the GUI and the library modules.
+
+Modules log to the "usb", "acpi", "ui" and "daemon" loggers under LOGGER. Records are
+put on a queue by the calling thread and written to a size-capped rotating
+file by a background thread, so logging never blocks on disk I/O. The
+subsystem loggers stay at INFO unless named in DELL_G_DEBUG (for example
+DELL_G_DEBUG=usb,acpi), so the per-call debug records of the hot paths
+are dropped by a level check.
+
+Without setup(), warnings and errors still reach stderr through the
+logging module's last-resort handler, which is what the CLI relies on.
+"""
+import os
+import queue
+import logging
+import logging.handlers
+from paths import state_dir
+
+LOGGER = "dgsc"
+SUBSYSTEMS = ("usb", "acpi", "ui", "daemon")
+MAX_BYTES = 1 << 20
+BACKUPS = 2
+FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+_listener = None
+
+
+def get_logger(subsystem):
+    return logging.getLogger("{}.{}".format(LOGGER, subsystem))
+
+
+def setup(path=None, level=logging.INFO, debug=None):
+    """Start logging to path (state_dir()/<app>.log by default) from a background thread.
+
+    debug lists the subsystems logged at DEBUG; it defaults to DELL_G_DEBUG.
+    Returns the log file path.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener.handlers[0].baseFilename
+    path = path or os.path.join(state_dir(), "dell-g-series-controller.log")
+    if debug is None:
+        debug = [name for name in os.environ.get("DELL_G_DEBUG", "").split(",") if name]
+
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=MAX_BYTES, backupCount=BACKUPS)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, handler)
+
+    root = logging.getLogger(LOGGER)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(level)
+    root.propagate = False
+    for subsystem in SUBSYSTEMS:
+        get_logger(subsystem).setLevel(logging.DEBUG if subsystem in debug else level)
+    _listener.start()
+    return path
+
+
+def shutdown():
+    """Flush the queued records and stop the writer thread."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener.handlers[0].close()
+    root = logging.getLogger(LOGGER)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.propagate = True
+    _listener = None
@@ -1,20 +1,31 @@
 #!/bin/python
 import sys
-import pexpect
-import tempfile
+import time
+import functools
+import threading
+import log
 import awelc
+import client
+from worker import Worker
+from telemetry import TelemetryScheduler
+from history import TelemetryHistory
+from graph import TelemetryGraph
+from fancurve import FanCurve, FanController, FanCurveEngine, DEFAULT_CURVES
+from preview import ColorPreview
 import PySide6
-from PySide6.QtCore import (QSettings, QTimer)
+from PySide6.QtCore import (QSettings, QTimer, Signal)
 from PySide6.QtGui import (QIcon, QAction)
-from PySide6.QtWidgets import (QColorDialog, QMessageBox,QGridLayout, QGroupBox, QWidget, QPushButton, QApplication,
-                               QVBoxLayout, QHBoxLayout, QDialog, QSlider, QLabel, QSystemTrayIcon, QMenu, QComboBox)
-from patch import g15_5530_patch
-from patch import g15_5520_patch
-from patch import g15_5515_patch
-from patch import g15_5511_patch
-from patch import g16_7630_patch
+from PySide6.QtWidgets import (QMessageBox,QGridLayout, QGroupBox, QWidget, QPushButton, QApplication,
+                               QVBoxLayout, QHBoxLayout, QDialog, QSlider, QLabel, QSystemTrayIcon, QMenu, QComboBox,
+                               QCheckBox, QLineEdit)
+
+logger = log.get_logger("ui")
+
+SENSOR_KEYS = ["get_fan1_rpm", "get_cpu_temp", "get_fan2_rpm", "get_gpu_temp"]
 
 class MainWindow(QWidget):
+    # From the daemon event thread: mode, power source or None
+    power_mode_switched = Signal(str, object)
 
     def __init__(self, parent=None):
         super(MainWindow, self).__init__(parent)
@@ -22,15 +33,9 @@ class MainWindow(QWidget):
         self.is_keyboard_supported = True # True by default, in case of no root access, keyboard lights should be adjustable.
         self.model = 'Unknown'
         self.tray_icon = None  # Will be set after tray icon is created
-        try:
-            self.logfile = open("/tmp/dell-g-series-controller.log","w")
-            sys.stdout = self.logfile
-        except:
-            print("Exception trying to open /tmp/dell-g-series-controller.log")
-            exit()
-        print("Log file:{}".format(self.logfile))
-        self.logfile.write("test")
-        self.init_acpi_call()
+        self.worker = Worker(self)  # Runs daemon requests off the GUI thread
+        self._telemetry = None
+        self.init_daemon()
         self.setMinimumWidth(600)
         self.setWindowTitle("Dell G Series Controller")
         # Read last choices from QSettings
@@ -42,132 +47,79 @@ class MainWindow(QWidget):
         grid.addWidget(QLabel(f'Dell {self.model}' if self.model != 'Unknown' else self.model), 0, 1)
         grid.addWidget(self._create_first_exclusive_group(), 1, 0)
         if (self.is_root and self.is_dell_g_series):
+            self.history = TelemetryHistory(SENSOR_KEYS)
             grid.addWidget(self._create_second_exclusive_group(), 1, 1)
-            self.timer = QTimer(self)    #timer to update fan rpm values
-            self.timer.setInterval(1000)
-            self.timer.timeout.connect(self.get_rpm_and_temp)
-            self.timer.start()
+            self._start_telemetry()
+            self.fan_curves = FanCurveEngine([], self.write_fan_boost)
+            self.fan_curve_enabled.setChecked(self.settings.value("Fan Curve", False, type=bool))
+        elif set(SENSOR_KEYS) <= set(self.sensors):
+            # No ACPI, but hwmon has the readings: show them without the controls
+            self.history = TelemetryHistory(SENSOR_KEYS)
+            grid.addWidget(self._create_sensor_group(), 1, 1)
+            self._start_telemetry()
         self.setLayout(grid)
 
-    def init_acpi_call(self):
-        self.power_modes_dict = {
-            "USTT_Balanced" : "0xa0",
-            "USTT_Performance" : "0xa1",
-            # "USTT_Cool" : "0xa2",   #Does not work
-            "USTT_Quiet" : "0xa3",
-            "USTT_FullSpeed": "0xa4",
-            "USTT_BatterySaver" : "0xa5",
-            "G Mode" : "0xab",
-            "Manual" : "0x0",
-        }
-            
-        self.acpi_call_dict = {
-            "get_laptop_model" : ["0x1a", "0x02", "0x02"],
-            "get_power_mode" : ["0x14", "0x0b", "0x00"],
-            "set_power_mode" : ["0x15", "0x01"],    #To be used with a parameter
-            "toggle_G_mode" : ["0x25", "0x01"],
-            "get_G_mode" : ["0x25", "0x02"],
-            "set_fan1_boost" : ["0x15", "0x02", "0x32"],            #To be used with a parameter
-            "get_fan1_boost" : ["0x14", "0x0c", "0x32"],
-            "get_fan1_rpm" : ["0x14", "0x05", "0x32"],
-            "get_cpu_temp" : ["0x14", "0x04", "0x01"],
-            "set_fan2_boost" : ["0x15", "0x02", "0x33"],            #To be used with a parameter
-            "get_fan2_boost" : ["0x14", "0x0c", "0x33"],
-            "get_fan2_rpm" : ["0x14", "0x05", "0x33"],
-            "get_gpu_temp" : ["0x14", "0x04", "0x06"]
-        }
-        
-        print("Attempting to create elevated bash subprocess.")
-        # Create a shell subprocess (root needed for power related functions)
-        self.shell = pexpect.spawn('bash', encoding='utf-8', logfile=self.logfile, env=None, args=["--noprofile", "--norc"])
-        self.shell.expect("[#$] ")
-        self.shell_exec(" export HISTFILE=/dev/null; history -c")
-        #Elevate privileges (pkexec is needed)
-        self.shell_exec("pkexec bash --noprofile --norc")
-        self.shell_exec(" export HISTFILE=/dev/null; history -c")
-        #Check if root or not
-        self.is_root = (self.shell_exec("whoami")[1].find("root") != -1)
+    def _start_telemetry(self):
+        self.telemetry = TelemetryScheduler()
+        self.timer = QTimer(self)    #timer for the next sensor read, idle while nothing needs data
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.get_rpm_and_temp)
+        # Subscribed for good, so the history also covers the time spent in the tray
+        self.telemetry.subscribe(self.history_updated, SENSOR_KEYS)
+        self.schedule_telemetry()
+
+    def init_daemon(self):
+        # The daemon owns the keyboard and the privileged ACPI helper; it is
+        # started (and asks for root once) if it is not running yet.
+        logger.info("Connecting to the control daemon.")
+        try:
+            self.daemon = client.connect(start=True)
+            # Separate connection so ACPI requests do not queue behind lighting ones
+            self.daemon_acpi = client.Client()
+        except (OSError, client.DaemonError) as err:
+            logger.error("Cannot reach the control daemon: %s", err)
+            QMessageBox.critical(self,"Error",f"Cannot start the control daemon:\n\n{err}")
+            sys.exit(1)
+        info = self.daemon.info()
+        self.is_root = info["acpi"]
+        self.power_modes = info["power_modes"]
+        self.is_keyboard_supported = info["keyboard"]
+        self.sensors = info.get("sensors", [])  # hwmon readings, available without root
         if not self.is_root:
-            print("Bash shell is NOT root. Disabling ACPI methods...")
+            logger.warning("ACPI helper is NOT running as root. Disabling ACPI methods...")
             popup = QMessageBox.warning(self,"Warning","No root access. Power related functions will not work, and will not be displayed.")
             return
 
-        print("Sh shell is root. Enabling ACPI methods...")
+        logger.info("ACPI helper is root. Enabling ACPI methods...")
 
-        self._check_laptop_model()
+        if info["model"] is not None:
+            logger.info("Detected dell %s. Laptop model: %s", info["model"].lower(), info["model_code"])
+            self.model = info["model"]
+        self.is_dell_g_series = info["supported"]
 
         if self.is_dell_g_series:
-            print("Laptop model is supported.")
+            logger.info("Laptop model is supported.")
         else:
             choice = QMessageBox.question(self,"Unrecognized laptop","Laptop model is NOT supported. Try ACPI methods for G15 5525 anyway? You might damage your hardware. Please do not do this if you don't know what you are doing!",QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
             self.is_dell_g_series = (choice == QMessageBox.StandardButton.Yes) #User override
-    
-    def _check_laptop_model(self):
-        """Check for supported laptop model"""
+            if self.is_dell_g_series:
+                self.daemon.override_model()
 
-        # Detect Intel models
-        self.acpi_cmd = "echo \"\\_SB.AMWW.WMAX 0 {} {{{}, {}, {}, 0x00}}\" | tee /proc/acpi/call; cat /proc/acpi/call"
-        laptop_model=self.acpi_call("get_laptop_model")
-        
-        # Check if G15 5530
-        if (laptop_model == "0x0"):
-            # TODO - VERIFY-ME - Is "0x0" really the expected response, or should we use a different ACPI call for this model?
-            print("Detected dell g15 5530. Laptop model: 0x{}".format(laptop_model))
-            self.is_dell_g_series = True
-            self.is_keyboard_supported = True
-            self.model = "G15 5530"
-            g15_5530_patch(self)
-            return
-
-        # Check if G15 5520
-        if (laptop_model == "0x12c0"):
-            print("Detected dell g15 5520. Laptop model: 0x{}".format(laptop_model))
-            self.is_dell_g_series = True
-            self.is_keyboard_supported = True
-            self.model = "G15 5520"
-            g15_5520_patch(self)
-            return
-
-        # Check if G15 5511
-        if (laptop_model == "0xc80"):
-            print("Detected dell g15 5511. Laptop model: 0x{}".format(laptop_model))
-            self.is_dell_g_series = True
-            self.is_keyboard_supported = True
-            self.model = "G15 5511"
-            g15_5511_patch(self)
-            return
-
-        # Check if G16 7630
-        if (laptop_model == "0x0"):
-            # TODO - VERIFY-ME - Is "0x0" really the expected response, or should we use a different ACPI call for this model?
-            print("Detected dell g16 7630. Laptop model: 0x{}".format(laptop_model))
-            self.is_dell_g_series = True
-            self.is_keyboard_supported = False
-            self.model = "G16 7630"
-            g16_7630_patch(self)
-            return 
-
-        # Detect AMD models
-        self.acpi_cmd = "echo \"\\_SB.AMW3.WMAX 0 {} {{{}, {}, {}, 0x00}}\" | tee /proc/acpi/call; cat /proc/acpi/call"
-        laptop_model=self.acpi_call("get_laptop_model")
-
-        # Check if G15 5525
-        if (laptop_model == "0x12c0"):
-            print("Detected dell g15 5525. Laptop model: 0x{}".format(laptop_model))
-            self.is_dell_g_series = True
-            self.is_keyboard_supported = True
-            self.model = "G15 5525"
-            return
-
-        # Check if G15 5515
-        if (laptop_model == "0xc80"):
-            print("Detected dell g15 5515. Laptop model: 0x{}".format(laptop_model))
-            self.is_dell_g_series = True
-            self.is_keyboard_supported = True
-            self.model = "G15 5515"
-            g15_5515_patch(self)
+        if self.is_dell_g_series:
+            # Follow switches made by the daemon (power source profiles) or other clients
+            self.power_mode_switched.connect(self._power_mode_switched)
+            self.daemon_events = client.Client(timeout=None)
+            self.daemon_events.on_power_mode = self.power_mode_switched.emit
+            self.daemon_events.watch_power()
+            threading.Thread(target=self.daemon_events.listen, name="daemon-events", daemon=True).start()
+
+    def close_daemon(self):
+        """Drop the connections; the daemon keeps running for other clients."""
+        self.daemon.close()
+        self.daemon_acpi.close()
+        if hasattr(self, 'daemon_events'):
+            self.daemon_events.close()
 
-        
     def _create_first_exclusive_group(self):
         groupBox = QGroupBox("Keyboard Led")
         vbox = QVBoxLayout()
@@ -191,7 +143,7 @@ class MainWindow(QWidget):
             self.green.setMinimum(0)
             self.green.setMaximum(255)
             self.green.setMinimumSize(100,0)
-            self.green.setValue(int(self.settings.value("Green", 122)))
+            self.green.setValue(int(self.settings.value("Green Static", 122)))
             self.green_morph_label = QLabel("Green Morph")
             self.green_morph = QSlider(orientation=PySide6.QtCore.Qt.Orientation(0x01))
             self.green_morph.setMinimum(0)
@@ -223,7 +175,14 @@ class MainWindow(QWidget):
             self.combobox_mode.setCurrentText(self.settings.value("Action", "Static Color"))
 
             self.button_apply = QPushButton("Apply")
+            self.live_preview = QCheckBox("Live preview")
+            self.live_preview.setChecked(self.settings.value("Live Preview", True, type=bool))
+            self.preview = ColorPreview()
+            self.preview_timer = QTimer(self)    #trailing write of coalesced slider moves
+            self.preview_timer.setSingleShot(True)
+            self.preview_timer.timeout.connect(self.push_preview)
             hbox.addWidget(self.combobox_mode)
+            hbox.addWidget(self.live_preview)
             hbox.addWidget(self.button_apply)
 
             # Add widgets to layout
@@ -246,6 +205,9 @@ class MainWindow(QWidget):
             # Add button callbacks
             self.combobox_mode.currentTextChanged.connect(self.combobox_choice)
             self.button_apply.clicked.connect(self.apply_leds)
+            self.live_preview.toggled.connect(self.toggle_live_preview)
+            for slider in (self.red, self.green, self.blue, self.red_morph, self.green_morph, self.blue_morph):
+                slider.valueChanged.connect(self.preview_leds)
 
         else:
             label = QLabel("Keyboard support not currently available for this model")
@@ -256,6 +218,21 @@ class MainWindow(QWidget):
         return groupBox
 
 
+    def _create_sensor_group(self):
+        groupBox = QGroupBox("Fans")
+        vbox = QVBoxLayout()
+        self.fan1_current = QLabel("0 RPM")
+        self.fan2_current = QLabel("0 RPM")
+        self.graph = TelemetryGraph(self.history, [("get_cpu_temp", "CPU", "#e06c75"),
+                                                   ("get_gpu_temp", "GPU", "#61afef")])
+        vbox.addWidget(QLabel("CPU Fan"))
+        vbox.addWidget(self.fan1_current)
+        vbox.addWidget(QLabel("GPU Fan"))
+        vbox.addWidget(self.fan2_current)
+        vbox.addWidget(self.graph)
+        groupBox.setLayout(vbox)
+        return groupBox
+
     def _create_second_exclusive_group(self):
         groupBox = QGroupBox("Power and Fans")
         vbox = QVBoxLayout()
@@ -265,7 +242,7 @@ class MainWindow(QWidget):
         
         #Power mode choice and Apply button
         self.combobox_mode_power = QComboBox()
-        self.combobox_mode_power.addItems(self.power_modes_dict.keys())
+        self.combobox_mode_power.addItems(self.power_modes)
         self.combobox_mode_power.setCurrentText(self.settings.value("Power", "USTT_Balanced"))
         self.info_label = QLabel("")
         self.info_label.setWordWrap(True)
@@ -300,18 +277,39 @@ class MainWindow(QWidget):
         hbox_fan2.addWidget(self.fan2_boost)
         hbox_fan2.addWidget(self.fan2_current)
 
+        #Fan curves, run in the background while enabled
+        widget_curve = QWidget()
+        grid_curve = QGridLayout(widget_curve)
+        self.fan_curve_enabled = QCheckBox("Automatic fan curves (°C:boost, ...)")
+        self.fan1_curve = QLineEdit(self.settings.value("Fan1 Curve", DEFAULT_CURVES["fan1"]))
+        self.fan2_curve = QLineEdit(self.settings.value("Fan2 Curve", DEFAULT_CURVES["fan2"]))
+        grid_curve.addWidget(self.fan_curve_enabled, 0, 0, 1, 2)
+        grid_curve.addWidget(QLabel("CPU"), 1, 0)
+        grid_curve.addWidget(self.fan1_curve, 1, 1)
+        grid_curve.addWidget(QLabel("GPU"), 2, 0)
+        grid_curve.addWidget(self.fan2_curve, 2, 1)
+
+        #Temperature history, last 10 minutes
+        self.graph = TelemetryGraph(self.history, [("get_cpu_temp", "CPU", "#e06c75"),
+                                                   ("get_gpu_temp", "GPU", "#61afef")])
+
         #Add widgets to layout
         vbox.addWidget(self.combobox_mode_power)
         vbox.addWidget(self.fan1_label)
         vbox.addWidget(widget_fan1)
         vbox.addWidget(self.fan2_label)
         vbox.addWidget(widget_fan2)
+        vbox.addWidget(widget_curve)
+        vbox.addWidget(self.graph)
         vbox.addWidget(self.info_label)
         
         # Add button callbacks
         self.combobox_mode_power.currentTextChanged.connect(self.combobox_power)
         self.fan1_boost.sliderReleased.connect(self.slider_fan1)
         self.fan2_boost.sliderReleased.connect(self.slider_fan2)
+        self.fan_curve_enabled.toggled.connect(self.toggle_fan_curves)
+        self.fan1_curve.editingFinished.connect(self.restart_fan_curves)
+        self.fan2_curve.editingFinished.connect(self.restart_fan_curves)
         
         #Return
         groupBox.setLayout(vbox)
@@ -323,135 +321,278 @@ class MainWindow(QWidget):
 
 
     def apply_leds(self):
-        try:
-            if self.settings.value("Action", "Static Color") == "Static Color":
-                self.apply_static()
-            elif self.settings.value("Action", "Static Color") == "Morph":
-                self.apply_morph()
-            elif self.settings.value("Action", "Static Color") == "Color and Morph":
-                self.apply_color_and_morph()    
-            else:   #Off
-                self.remove_animation()
-        except Exception as err:
-            QMessageBox.warning(self,"Error",f"Cannot apply LED settings:\n\n{err.__class__.__name__}: {err}")
-            raise err
+        if self.settings.value("Action", "Static Color") == "Static Color":
+            self.apply_static()
+        elif self.settings.value("Action", "Static Color") == "Morph":
+            self.apply_morph()
+        elif self.settings.value("Action", "Static Color") == "Color and Morph":
+            self.apply_color_and_morph()    
+        else:   #Off
+            self.remove_animation()
+
+
+    def toggle_live_preview(self, enabled):
+        self.settings.setValue("Live Preview", enabled)
+        if enabled:
+            self.preview_leds()
+        elif self.preview.dirty:
+            self.restore_leds()
+
+
+    def preview_leds(self):
+        """Show the slider colors on the keyboard without storing them."""
+        if not self.live_preview.isChecked():
+            return
+        static = (self.red.value(), self.green.value(), self.blue.value())
+        morph = (self.red_morph.value(), self.green_morph.value(), self.blue_morph.value())
+        mode = self.combobox_mode.currentText()
+        if mode == "Static Color":
+            colors = [(awelc.ZONES, static)]
+        elif mode == "Morph":
+            colors = [(awelc.ZONES, morph)]
+        elif mode == "Color and Morph":
+            colors = [(awelc.ZONES_KB, static), (awelc.ZONES_NP, morph)]
+        else:
+            return
+        self.preview.update(colors)
+        self.push_preview()
+
+
+    def push_preview(self):
+        """Send the newest preview once the link is free and the rate allows."""
+        delay = self.preview.delay()
+        if delay is None:
+            return
+        if delay > 0:
+            if not self.preview_timer.isActive():
+                self.preview_timer.start(int(delay * 1000) + 1)
+            return
+        self.worker.submit("usb", self.daemon.set_colors, self.preview.take(),
+                           callback=self._preview_sent, errback=self._preview_failed)
+
+
+    def _preview_sent(self, _):
+        self.preview.done()
+        self.push_preview()
+
+
+    def _preview_failed(self, err):
+        self.preview.done()
+        logger.warning("Cannot preview LED colors: %s: %s", err.__class__.__name__, err)
+
+
+    def _end_preview(self):
+        """Drop pending previews; the next write takes the keyboard back from a shown one."""
+        self.preview.reset()
+        self.preview_timer.stop()
+
+
+    def restore_leds(self):
+        """Write the applied lighting again, replacing an unapplied preview."""
+        self._end_preview()
+        value = lambda key: int(self.settings.value(key, 122))
+        action = self.settings.value("Action", "Static Color")
+        duration = int(self.settings.value("Duration", 255))
+        if action == "Static Color":
+            self.run_leds({}, "set_static",
+                          value("Red Static"), value("Green Static"), value("Blue Static"))
+        elif action == "Morph":
+            self.run_leds({}, "set_morph",
+                          value("Red Morph"), value("Green Morph"), value("Blue Morph"), duration)
+        elif action == "Color and Morph":
+            self.run_leds({}, "set_color_and_morph",
+                          value("Red Static"), value("Green Static"), value("Blue Static"),
+                          value("Red Morph"), value("Green Morph"), value("Blue Morph"), duration)
+        else:
+            self.run_leds({}, "remove_animation")
+
+
+    def run_leds(self, settings, operation, *args, **kwargs):
+        """Run a lighting operation in the daemon and save settings once it succeeded."""
+        if hasattr(self, 'button_apply'):
+            self.button_apply.setEnabled(False)
+        self.worker.submit("usb", functools.partial(self.daemon.request, operation, *args, **kwargs),
+                           callback=lambda _: self._leds_applied(settings),
+                           errback=self._leds_failed)
+
+
+    def _leds_applied(self, settings):
+        if hasattr(self, 'button_apply'):
+            self.button_apply.setEnabled(True)
+        for key, value in settings.items():
+            self.settings.setValue(key, value)
+
+
+    def _leds_failed(self, err):
+        if hasattr(self, 'button_apply'):
+            self.button_apply.setEnabled(True)
+        logger.error("Cannot apply LED settings: %s: %s", err.__class__.__name__, err)
+        QMessageBox.warning(self,"Error",f"Cannot apply LED settings:\n\n{err.__class__.__name__}: {err}")
 
 
     def combobox_power(self):
         choice = self.combobox_mode_power.currentText()
         self.settings.setValue("Power", choice)
-        self.apply_power_mode(choice)
-        
         # 显示系统通知（仅当用户在GUI中手动切换时）
-        if self.tray_icon:
-            self.tray_icon.show_power_mode_notification(choice)
+        self.apply_power_mode(choice, notify=True)
 
 
     def slider_fan1(self):
         #Fan1 has id 0x32
-        #Get current fan boost
-        fan1_last_boost = self.acpi_call("get_fan1_boost")
-        #Set new fan boost
-        new_val = self.fan1_boost.value()
-        self.acpi_call("set_fan1_boost","0x{:2X}".format(new_val))
-        #Get current fan boost
-        fan1_new_boost = self.acpi_call("get_fan1_boost")
-        self.info_label.setText("Fan1 Boost: {:.0f}% to {:.0f}%.".format(int(fan1_last_boost,0)/0xff*100,int(fan1_new_boost,0)/0xff*100))
+        self.worker.submit("acpi", self.set_fan_boost, "fan1", self.fan1_boost.value(),
+                           callback=self.info_label.setText)
 
 
     def slider_fan2(self):
         #Fan2 has id 0x33
-        #Get current fan boost
-        fan2_last_boost = self.acpi_call("get_fan2_boost")
-        #Set new fan boost
-        new_val = self.fan2_boost.value()
-        self.acpi_call("set_fan2_boost","0x{:2X}".format(new_val))
-        #Get current fan boost
-        fan2_new_boost = self.acpi_call("get_fan2_boost")
-        self.info_label.setText("Fan2 Boost: {:.0f}% to {:.0f}%.".format(int(fan2_last_boost,0)/0xff*100,int(fan2_new_boost,0)/0xff*100))
+        self.worker.submit("acpi", self.set_fan_boost, "fan2", self.fan2_boost.value(),
+                           callback=self.info_label.setText)
 
 
-    def get_rpm_and_temp(self):
-        if self.isVisible():
-            #Get current rpm and temp
-            fan1_rpm = self.acpi_call("get_fan1_rpm")
-            cpu_temp = self.acpi_call("get_cpu_temp")
-            fan2_rpm = self.acpi_call("get_fan2_rpm")
-            gpu_temp = self.acpi_call("get_gpu_temp")
-            self.fan1_current.setText("{} RPM, {} °C".format(int(fan1_rpm,0),int(cpu_temp,0)))
-            self.fan2_current.setText("{} RPM, {} °C".format(int(fan2_rpm,0),int(gpu_temp,0)))
-    # Helper Functions
-    
-    #Execute given command in elevated shell
-    def acpi_call(self, cmd, arg1="0x00", arg2="0x00"):
-        args = self.acpi_call_dict[cmd]
-        if len(args)==4:
-            cmd_current = self.acpi_cmd.format(args[0], args[1], args[2], args[3])
-        elif len(args)==3:
-            cmd_current = self.acpi_cmd.format(args[0], args[1], args[2], arg1)
-        elif len(args)==2:
-            cmd_current = self.acpi_cmd.format(args[0], args[1], arg1, arg2)
+    def set_fan_boost(self, fan, new_val):
+        """Set a fan boost and describe the change. Runs on the acpi lane."""
+        last_boost, new_boost = self.daemon_acpi.set_fan_boost(fan, new_val)
+        return "{} Boost: {:.0f}% to {:.0f}%.".format(fan.capitalize(),last_boost/0xff*100,new_boost/0xff*100)
+
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.timer is not None:
+            self.telemetry.subscribe(self.show_rpm_and_temp, SENSOR_KEYS)
+            self.schedule_telemetry()
+
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        if self.is_keyboard_supported and self.preview.dirty:
+            self.restore_leds()
+        if self.timer is not None:
+            self.telemetry.unsubscribe(self.show_rpm_and_temp)
+            self.schedule_telemetry()
+
+
+    def schedule_telemetry(self):
+        """Arm the timer for the next due sensor, or stop it if nothing needs data."""
+        if self._telemetry is not None and not self._telemetry.done():
+            return  # Rescheduled when the running read finishes
+        deadline = self.telemetry.next_deadline()
+        if deadline is None:
+            self.timer.stop()
         else:
-            cmd_current=""
-        return self.parse_shell_exec(self.shell_exec(cmd_current)[2])   #Return parsed second line
+            self.timer.start(max(0, int((deadline - time.monotonic()) * 1000)))
+
+
+    def toggle_fan_curves(self, enabled):
+        self.settings.setValue("Fan Curve", enabled)
+        self.fan_curves.stop()
+        if enabled:
+            try:
+                fan1_curve = FanCurve.parse(self.fan1_curve.text())
+                fan2_curve = FanCurve.parse(self.fan2_curve.text())
+            except ValueError as err:
+                QMessageBox.warning(self,"Error",f"Invalid fan curve:\n\n{err}")
+                self.fan_curve_enabled.setChecked(False)
+                return
+            self.settings.setValue("Fan1 Curve", str(fan1_curve))
+            self.settings.setValue("Fan2 Curve", str(fan2_curve))
+            self.fan_curves.controllers = [FanController(fan1_curve, "get_cpu_temp", "set_fan1_boost"),
+                                           FanController(fan2_curve, "get_gpu_temp", "set_fan2_boost")]
+            self.fan_curves.start(self.telemetry)
+        self.fan1_boost.setEnabled(not enabled)
+        self.fan2_boost.setEnabled(not enabled)
+        self.schedule_telemetry()
+
+
+    def restart_fan_curves(self):
+        if self.fan_curves.running:
+            self.toggle_fan_curves(True)
+
+
+    def write_fan_boost(self, cmd, boost):
+        fan = "fan1" if cmd == "set_fan1_boost" else "fan2"
+        self.worker.submit("acpi", self.daemon_acpi.write_fan_boost, fan, boost)
+        slider = self.fan1_boost if cmd == "set_fan1_boost" else self.fan2_boost
+        slider.setValue(boost)
+
 
+    def get_rpm_and_temp(self):
+        keys = self.telemetry.due(time.monotonic())
+        if not keys:
+            self.schedule_telemetry()
+            return
+        #Get current rpm and temp, all in one round trip
+        self._telemetry = self.worker.submit("acpi", self.daemon_acpi.read, keys,
+                                             callback=self._telemetry_read,
+                                             errback=lambda err: self._telemetry_failed(keys, err))
 
-    def shell_exec(self, cmd : str):
-        print("Bash: Executing {}".format(cmd))
-        self.shell.sendline(cmd)
-        self.shell.expect("[#$] ")
-        result = self.shell.before
-        result = result.split('\n')
-        for line in result[1:]: #First line is the command that was sent
-            print(line)
-        return result
 
+    def _telemetry_read(self, values):
+        now = time.monotonic()
+        self.history.record(values, now)
+        self.telemetry.update(values, now)
+        self.schedule_telemetry()
 
-    def parse_shell_exec(self,line:str):
-        return line[line.find('\r')+1:line.find('\x00')] #Read between carriage return and end of the line (disregard color)
 
+    def history_updated(self, values):
+        if self.graph.isVisible():
+            self.graph.update()
 
+
+    def _telemetry_failed(self, keys, err):
+        logger.warning("Cannot read sensors: %s: %s", err.__class__.__name__, err)
+        self.telemetry.failed(keys, time.monotonic())
+        self.schedule_telemetry()
+
+
+    def show_rpm_and_temp(self, values):
+        self.fan1_current.setText("{} RPM, {} °C".format(values["get_fan1_rpm"],values["get_cpu_temp"]))
+        self.fan2_current.setText("{} RPM, {} °C".format(values["get_fan2_rpm"],values["get_gpu_temp"]))
     # Apply given colors to keyboard.
     def apply_static(self):
-        awelc.set_static(self.red.value(), self.green.value(),
-                         self.blue.value())
-        self.settings.setValue("Action", "Static Color")
-        self.settings.setValue("Red Static", self.red.value())
-        self.settings.setValue("Green Static", self.green.value())
-        self.settings.setValue("Blue Static", self.blue.value())
-        self.settings.setValue("Duration", self.duration.value())
-        self.settings.setValue("State", "On")
+        self._end_preview()
+        self.run_leds({
+            "Action": "Static Color",
+            "Red Static": self.red.value(),
+            "Green Static": self.green.value(),
+            "Blue Static": self.blue.value(),
+            "Duration": self.duration.value(),
+            "State": "On",
+        }, "set_static", self.red.value(), self.green.value(), self.blue.value())
 
 
     def apply_morph(self):
-        awelc.set_morph(self.red_morph.value(), self.green_morph.value(),
-                        self.blue_morph.value(), self.duration.value())
-        self.settings.setValue("Action", "Morph")
-        self.settings.setValue("Red Morph", self.red_morph.value())
-        self.settings.setValue("Green Morph", self.green_morph.value())
-        self.settings.setValue("Blue Morph", self.blue_morph.value())
-        self.settings.setValue("Duration", self.duration.value())
-        self.settings.setValue("State", "On")
+        self._end_preview()
+        self.run_leds({
+            "Action": "Morph",
+            "Red Morph": self.red_morph.value(),
+            "Green Morph": self.green_morph.value(),
+            "Blue Morph": self.blue_morph.value(),
+            "Duration": self.duration.value(),
+            "State": "On",
+        }, "set_morph", self.red_morph.value(), self.green_morph.value(),
+           self.blue_morph.value(), self.duration.value())
 
 
     def apply_color_and_morph(self):
-        awelc.set_color_and_morph(self.red.value(), self.green.value(),
-                        self.blue.value(), self.red_morph.value(), self.green_morph.value(),
-                        self.blue_morph.value(), self.duration.value())
-        self.settings.setValue("Action", "Color and Morph")
-        self.settings.setValue("Red Static", self.red.value())
-        self.settings.setValue("Green Static", self.green.value())
-        self.settings.setValue("Blue Static", self.blue.value())
-        self.settings.setValue("Red Morph", self.red_morph.value())
-        self.settings.setValue("Green Morph", self.green_morph.value())
-        self.settings.setValue("Blue Morph", self.blue_morph.value())
-        self.settings.setValue("Duration", self.duration.value())
-        self.settings.setValue("State", "On")
+        self._end_preview()
+        self.run_leds({
+            "Action": "Color and Morph",
+            "Red Static": self.red.value(),
+            "Green Static": self.green.value(),
+            "Blue Static": self.blue.value(),
+            "Red Morph": self.red_morph.value(),
+            "Green Morph": self.green_morph.value(),
+            "Blue Morph": self.blue_morph.value(),
+            "Duration": self.duration.value(),
+            "State": "On",
+        }, "set_color_and_morph", self.red.value(), self.green.value(),
+           self.blue.value(), self.red_morph.value(), self.green_morph.value(),
+           self.blue_morph.value(), self.duration.value())
 
 
     def remove_animation(self):
-        awelc.remove_animation()
-        self.settings.setValue("State", "Off")
+        self._end_preview()
+        self.run_leds({"State": "Off"}, "remove_animation")
 
     # Apply last action when called from system tray
     def tray_on(self):
@@ -461,14 +602,12 @@ class MainWindow(QWidget):
         #     self.apply_morph()
         # else:  #Off
         #     self.remove_animation()
-        awelc.set_dim(0)
-        self.settings.setValue("State", "On")
+        self.run_leds({"State": "On"}, "set_dim", 0)
 
     def tray_off(self):
         # awelc.set_static(0, 0, 0)
         # awelc.remove_animation()
-        awelc.set_dim(100)
-        self.settings.setValue("State", "Off")
+        self.run_leds({"State": "Off"}, "set_dim", 100)
 
     def toggle_power_mode(self):
         """切换电源模式，在 Balance 和 G Mode 之间切换"""
@@ -486,44 +625,66 @@ class MainWindow(QWidget):
         # 更新设置
         self.settings.setValue("Power", new_mode)
         
+        self._show_power_mode(new_mode)
+        
+        # 应用新的电源模式
+        self.apply_power_mode(new_mode, notify=True)
+
+    def _show_power_mode(self, mode):
         # 如果窗口可见，更新ComboBox（暂时断开信号避免重复触发）
         if hasattr(self, 'combobox_mode_power'):
             self.combobox_mode_power.currentTextChanged.disconnect()
-            self.combobox_mode_power.setCurrentText(new_mode)
+            self.combobox_mode_power.setCurrentText(mode)
             self.combobox_mode_power.currentTextChanged.connect(self.combobox_power)
-        
-        # 应用新的电源模式
-        self.apply_power_mode(new_mode)
-        
-        # 显示系统通知
-        if self.tray_icon:
-            self.tray_icon.show_power_mode_notification(new_mode)
     
-    def apply_power_mode(self, mode):
+    def apply_power_mode(self, mode, notify=False):
         """应用指定的电源模式"""
         if not self.is_root or not self.is_dell_g_series:
             return
-        
+        started = time.perf_counter()
+        self.worker.submit("acpi", self.set_power_mode, mode,
+                           callback=lambda writes: self._power_mode_applied(mode, writes, started, notify),
+                           errback=self._power_mode_failed)
+
+    def set_power_mode(self, mode):
+        """Write the power mode and G mode state. Runs on the acpi lane."""
+        return self.daemon_acpi.set_power_mode(mode)
+
+    def _power_mode_applied(self, mode, writes, started, notify):
+        elapsed = (time.perf_counter() - started) * 1000
+        if writes:
+            self._boosts_reset()
+            message = "Power mode switched to {} in {:.0f} ms".format(mode, elapsed)
+        else:
+            message = "Power mode already {}".format(mode)
+        # 显示消息（如果窗口可见且有info_label）
+        if hasattr(self, 'info_label') and self.isVisible():
+            self.info_label.setText(message)
+        logger.info("Power mode %s: %s in %.1f ms", mode, writes, elapsed)
+        if notify and self.tray_icon:
+            self.tray_icon.show_power_mode_notification(mode, elapsed)
+
+    def _boosts_reset(self):
         # 重置风扇增强
         if hasattr(self, 'fan1_boost'):
             self.fan1_boost.setValue(0)
         if hasattr(self, 'fan2_boost'):
             self.fan2_boost.setValue(0)
-        
-        # 设置电源模式
-        mode_value = self.power_modes_dict[mode]
-        self.acpi_call("set_power_mode", mode_value)
-        
-        # 处理G模式
-        result = self.acpi_call("get_G_mode")
-        if (mode == "G Mode") != (result == "0x1"):  # 如果需要切换G模式
-            self.acpi_call("toggle_G_mode")
-        
-        # 显示消息（如果窗口可见且有info_label）
-        if hasattr(self, 'info_label') and self.isVisible():
-            self.info_label.setText(f"Power mode switched to {mode}")
-        
-        print(f"Power mode switched to {mode}")
+        # The switch reset the boosts, so the curves must write theirs again
+        if hasattr(self, 'fan_curves'):
+            self.fan_curves.reset()
+
+    def _power_mode_switched(self, mode, source):
+        """The daemon switched the power mode, for a power source or for any client."""
+        logger.info("Power mode is now %s (%s)", mode, "on " + source if source else "client request")
+        self.settings.setValue("Power", mode)
+        self._show_power_mode(mode)
+        self._boosts_reset()
+
+    def _power_mode_failed(self, err):
+        logger.error("Cannot switch power mode: %s: %s", err.__class__.__name__, err)
+        if hasattr(self, 'info_label'):
+            self.info_label.setText("Cannot switch power mode: {}".format(err))
 
 
 class TrayIcon(QSystemTrayIcon):
@@ -540,13 +701,16 @@ class TrayIcon(QSystemTrayIcon):
         if reason == QSystemTrayIcon.ActivationReason.Trigger:
             self.window.toggle_power_mode()
     
-    def show_power_mode_notification(self, mode):
+    def show_power_mode_notification(self, mode, elapsed=None):
         """显示电源模式切换通知"""
         title = "Dell G Series Controller"
         message = f"Power mode switched to: {mode}"
+        if elapsed is not None:
+            message += f" ({elapsed:.0f} ms)"
         self.showMessage(title, message, QSystemTrayIcon.MessageIcon.Information, 3000)
 
 if __name__ == '__main__':
+    logger.info("Logging to %s", log.setup())
     # Create the Qt Application
     app = QApplication(sys.argv)
     icon = QIcon.fromTheme("alienarena")
@@ -579,6 +743,9 @@ if __name__ == '__main__':
 
     # Register callbacks
     quit.triggered.connect(app.quit)
+    app.aboutToQuit.connect(window.worker.shutdown)
+    app.aboutToQuit.connect(window.close_daemon)
+    app.aboutToQuit.connect(log.shutdown)
     show.triggered.connect(window.show)
     toggle_power.triggered.connect(lambda: window.toggle_power_mode())
 
@@ -0,0 +1,53 @@
+import os
+import json
+import logging
+from paths import cache_file
+
+log = logging.getLogger("dgsc.acpi")
+
+DMI_DIR = "/sys/class/dmi/id"
+# World-readable identifiers; a BIOS update or a different machine changes them
+DMI_KEYS = ("sys_vendor", "product_name", "product_sku", "board_name", "bios_version")
+
+
+def read_dmi(root=DMI_DIR):
+    dmi = {}
+    for key in DMI_KEYS:
+        try:
+            with open(os.path.join(root, key)) as f:
+                dmi[key] = f.read().strip()
+        except OSError:
+            pass
+    return dmi
+
+
+class ModelCache:
+    """Remembers the laptop model detection result for this machine.
+
+    An entry is only used while the DMI identifiers it was stored with
+    still match, so a BIOS update or a different product invalidates it.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+
+    def load(self, dmi):
+        try:
+            self.path = self.path or cache_file("model.json")
+            with open(self.path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not dmi or entry.get("dmi") != dmi:
+            return None
+        return entry.get("result")
+
+    def store(self, dmi, result):
+        try:
+            self.path = self.path or cache_file("model.json")
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"dmi": dmi, "result": result}, f)
+            os.replace(tmp, self.path)
+        except OSError as err:
+            log.warning("Cannot cache the laptop model: %s", err)
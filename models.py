@@ -0,0 +1,98 @@
+from collections import namedtuple
+from acpi import Acpi, INTEL_WMAX, AMD_WMAX
+
+WMAX_PATHS = (INTEL_WMAX, AMD_WMAX)
+
+POWER_MODES = {
+    "USTT_Balanced" : "0xa0",
+    "USTT_Performance" : "0xa1",
+    # "USTT_Cool" : "0xa2",   #Does not work
+    "USTT_Quiet" : "0xa3",
+    "USTT_FullSpeed": "0xa4",
+    "USTT_BatterySaver" : "0xa5",
+    "G Mode" : "0xab",
+    "Manual" : "0x0",
+}
+
+
+def _power_modes(remove=(), add=None):
+    modes = {name: value for name, value in POWER_MODES.items() if name not in remove}
+    modes.update(add or {})
+    return modes
+
+
+# dmi_product is /sys/class/dmi/id/product_name. It only matters when
+# several models give the same get_laptop_model reply on the same path.
+Model = namedtuple("Model", "name wmax code dmi_product keyboard power_modes")
+
+MODELS = [
+    # TODO - VERIFY-ME - Is "0x0" really the expected response for the G15 5530 and G16 7630?
+    Model("G15 5530", INTEL_WMAX, "0x0", "Dell G15 5530", True,
+          _power_modes(remove=("USTT_FullSpeed",))),
+    Model("G16 7630", INTEL_WMAX, "0x0", "Dell G16 7630", False,
+          _power_modes(remove=("USTT_FullSpeed",))),
+    Model("G15 5520", INTEL_WMAX, "0x12c0", "Dell G15 5520", True,
+          _power_modes(remove=("USTT_FullSpeed",))),
+    Model("G15 5511", INTEL_WMAX, "0xc80", "Dell G15 5511", True,
+          _power_modes(remove=("USTT_FullSpeed", "USTT_BatterySaver"), add={"USTT_Cool": "0xa2"})),
+    Model("G15 5525", AMD_WMAX, "0x12c0", "Dell G15 5525", True,
+          _power_modes()),
+    Model("G15 5515", AMD_WMAX, "0xc80", "Dell G15 5515", True,
+          _power_modes(remove=("USTT_Balanced", "USTT_Performance", "USTT_Quiet",
+                               "USTT_FullSpeed", "USTT_BatterySaver"))),
+]
+
+# Precompiled lookups: (wmax, code) gives the first row as a fallback when
+# the DMI product is unknown, (wmax, code, product) the exact row.
+_BY_PROBE = {}
+_BY_PRODUCT = {}
+for _model in MODELS:
+    _BY_PROBE.setdefault((_model.wmax, _model.code), _model)
+    _BY_PRODUCT[(_model.wmax, _model.code, _model.dmi_product)] = _model
+
+
+def lookup(wmax, code, product=None):
+    """Return the Model for a get_laptop_model reply on a WMAX path, or None."""
+    return _BY_PRODUCT.get((wmax, code, product)) or _BY_PROBE.get((wmax, code))
+
+
+def detect(helper, product=None):
+    """Probe every WMAX path in one round trip.
+
+    Returns (model, code) for the reply matching a known model, preferring
+    an exact DMI product match, or None.
+    """
+    requests = [Acpi(helper, wmax).format("get_laptop_model") for wmax in WMAX_PATHS]
+    replies = list(zip(WMAX_PATHS, helper.execute_batch(requests, strict=False)))
+    for wmax, code in replies:
+        model = _BY_PRODUCT.get((wmax, code, product))
+        if model is not None:
+            return model, code
+    for wmax, code in replies:
+        model = _BY_PROBE.get((wmax, code))
+        if model is not None:
+            return model, code
+    return None
+
+
+def identify(helper, cache=None):
+    """Return (model, code) for this laptop, or None if it is not supported.
+
+    A result cached for this machine's DMI identifiers is used as is;
+    otherwise the WMAX paths are probed and a match is cached.
+    """
+    from model_cache import ModelCache, read_dmi
+    cache = cache or ModelCache()
+    dmi = read_dmi()
+    product = dmi.get("product_name")
+    cached = cache.load(dmi)
+    if cached is not None:
+        model = lookup(cached["wmax"], cached["model_code"], product)
+        if model is not None:
+            return model, cached["model_code"]
+    detected = detect(helper, product)
+    if detected is not None:
+        model, code = detected
+        cache.store(dmi, {"wmax": model.wmax, "model_code": code,
+                          "model": model.name, "power_modes": model.power_modes})
+    return detected
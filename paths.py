@@ -0,0 +1,57 @@
+import os
+import stat
+
+APP_NAME = "dell-g-series-controller"
+
+
+def cache_dir():
+    """Per-user cache directory, created on first use."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(base, APP_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cache_file(name):
+    return os.path.join(cache_dir(), name)
+
+
+def state_dir():
+    """Per-user state directory (logs), created on first use."""
+    base = os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state")
+    path = os.path.join(base, APP_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def runtime_dir():
+    """Per-user runtime directory (sockets), private to the user."""
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if base:
+        return base
+    path = os.path.join("/tmp", "{}-{}".format(APP_NAME, os.getuid()))
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    # Anyone can create it first in /tmp; only trust our own private directory
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o700:
+        raise PermissionError("{} is not a private directory owned by you".format(path))
+    return path
+
+
+def socket_path():
+    return os.path.join(runtime_dir(), APP_NAME + ".sock")
+
+
+def config_dir():
+    """Per-user settings directory, created on first use."""
+    base = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    path = os.path.join(base, APP_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def config_file(name):
+    return os.path.join(config_dir(), name)
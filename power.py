@@ -0,0 +1,88 @@
+"""Power mode and fan boost operations on top of an Acpi instance."""
+import time
+
+
+def apply_power_mode(acpi, power_modes, mode):
+    """Switch to power mode name, toggling G mode to match it."""
+    # 设置电源模式
+    acpi.call("set_power_mode", power_modes[mode])
+
+    # 处理G模式
+    result = acpi.call("get_G_mode")
+    if (mode == "G Mode") != (result == "0x1"):  # 如果需要切换G模式
+        acpi.call("toggle_G_mode")
+
+
+class PowerState:
+    """Power mode and G mode as last read or written, to skip writes that change nothing.
+
+    The state is read from the firmware on first use and trusted for
+    max_age seconds after each read or write; older state is read again
+    before the next switch, since the G key toggles G mode behind our
+    back. Only the writes needed are sent. A power mode write can change G
+    mode too, so when a toggle looks needed G mode is read again in the
+    same round trip as the write, and toggled only if it still disagrees.
+    """
+
+    def __init__(self, acpi, power_modes, max_age=10.0):
+        self.acpi = acpi
+        self.power_modes = power_modes
+        self.max_age = max_age
+        self.mode = None        # Raw get_power_mode value
+        self.g_mode = None
+        self.checked = float("-inf")
+
+    def refresh(self, now=None):
+        values = self.acpi.call_batch(["get_power_mode", "get_G_mode"])
+        self.mode = values["get_power_mode"]
+        self.g_mode = values["get_G_mode"] == 1
+        self.checked = time.monotonic() if now is None else now
+
+    def apply(self, mode, now=None):
+        """Switch to power mode name; returns the ACPI writes it took."""
+        if now is None:
+            now = time.monotonic()
+        if self.mode is None or now - self.checked > self.max_age:
+            self.refresh(now)
+        writes = []
+        value = self.power_modes[mode]
+        try:
+            if int(value, 0) != self.mode:
+                writes.append(("set_power_mode", value))
+                if (mode == "G Mode") != self.g_mode:
+                    # Batched calls run in order, so this reads G mode after the write
+                    replies = self.acpi.call_many([writes[-1], ("get_G_mode",)])
+                    self.g_mode = int(replies[1], 0) == 1
+                else:
+                    self.acpi.call_many(writes[-1:])
+                self.mode = int(value, 0)
+            if (mode == "G Mode") != self.g_mode:
+                writes.append(("toggle_G_mode",))
+                self.acpi.call_many(writes[-1:])
+                self.g_mode = mode == "G Mode"
+        except Exception:
+            self.mode = None    # Unknown how far it got
+            raise
+        if writes:
+            self.checked = now
+        return writes
+
+
+def get_power_mode(acpi, power_modes):
+    """Return the name of the current power mode, or its raw value if unknown."""
+    value = int(acpi.call("get_power_mode"), 0)
+    for name, mode_value in power_modes.items():
+        if int(mode_value, 0) == value:
+            return name
+    return hex(value)
+
+
+def set_fan_boost(acpi, fan, boost):
+    """Set the boost (0-255) of "fan1" or "fan2"; returns (previous, new) boost."""
+    #Get current fan boost
+    last_boost = acpi.call("get_{}_boost".format(fan))
+    #Set new fan boost
+    acpi.call("set_{}_boost".format(fan), "0x{:02X}".format(boost))
+    #Get current fan boost
+    new_boost = acpi.call("get_{}_boost".format(fan))
+    return int(last_boost, 0), int(new_boost, 0)
@@ -0,0 +1,153 @@
+"""Event-driven AC/battery detection.
+
+PowerSourceWatcher exposes a file descriptor that becomes readable when a
+power supply changes, for select() or an event loop's add_reader(), so
+nothing is polled. On the real /sys/class/power_supply it listens to the
+kernel's power_supply uevents on a netlink socket, since sysfs attributes
+do not raise inotify events. Any other root, such as a directory of fake
+supplies, is watched with inotify, which is how it is tested.
+
+The state is read from the "online" attribute of every "Mains" supply; the
+files stay open and are read with os.pread.
+"""
+import os
+import json
+import socket
+import ctypes
+import ctypes.util
+import logging
+
+from paths import config_file
+
+log = logging.getLogger("dgsc.daemon")
+
+SUPPLY_DIR = "/sys/class/power_supply"
+AC = "ac"
+BATTERY = "battery"
+SOURCES = (AC, BATTERY)
+
+NETLINK_KOBJECT_UEVENT = 15
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+
+
+def _inotify():
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    return libc, fd
+
+
+class PowerSourceWatcher:
+    """Calls callback(source) with AC or BATTERY when the power source changes."""
+
+    def __init__(self, callback, root=SUPPLY_DIR, netlink=None):
+        self.callback = callback
+        self.root = root
+        self.netlink = root == SUPPLY_DIR if netlink is None else netlink
+        self.source = None
+        self._online = []
+        self._socket = None
+        self._fd = None
+
+    def start(self):
+        """Open the supplies and the event source; returns the current source."""
+        for name in sorted(os.listdir(self.root)):
+            try:
+                with open(os.path.join(self.root, name, "type")) as f:
+                    kind = f.read().strip()
+            except OSError:
+                continue
+            if kind == "Mains":
+                self._online.append(os.open(os.path.join(self.root, name, "online"), os.O_RDONLY))
+        if self.netlink:
+            self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            self._socket.bind((0, 1))   # Kernel uevent multicast group
+            self._socket.setblocking(False)
+            self._fd = self._socket.fileno()
+        else:
+            libc, self._fd = _inotify()
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name, "online")
+                if os.path.exists(path):
+                    libc.inotify_add_watch(self._fd, path.encode(), IN_MODIFY | IN_CLOSE_WRITE)
+        self.source = self.read()
+        return self.source
+
+    def fileno(self):
+        return self._fd
+
+    def read(self):
+        """AC if any mains supply is online; None while no value can be read."""
+        if not self._online:
+            return AC   # Desktops and unknown hardware: never on battery
+        unreadable = False
+        for fd in self._online:
+            value = os.pread(fd, 16, 0).strip()
+            if value == b"1":
+                return AC
+            if value != b"0":
+                unreadable = True   # Caught mid-write
+        return None if unreadable else BATTERY
+
+    def handle(self):
+        """Drain the pending events and report a change of source."""
+        relevant = not self.netlink
+        try:
+            while True:
+                if self.netlink:
+                    message = self._socket.recv(8192)
+                    relevant |= b"SUBSYSTEM=power_supply" in message
+                else:
+                    os.read(self._fd, 4096)
+        except BlockingIOError:
+            pass
+        if not relevant:
+            return
+        source = self.read()
+        if source is not None and source != self.source:
+            self.source = source
+            log.info("Power source changed to %s", source)
+            self.callback(source)
+
+    def close(self):
+        for fd in self._online:
+            os.close(fd)
+        self._online = []
+        if self._socket is not None:
+            self._socket.close()
+        elif self._fd is not None:
+            os.close(self._fd)
+        self._socket = self._fd = None
+
+
+class SourceProfiles:
+    """Power mode and fan boosts to switch to on AC and on battery.
+
+    Stored as {"ac": {"power_mode": ..., "fan1": ..., "fan2": ...}, ...};
+    a missing source or entry leaves that setting alone.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config_file("power_sources.json")
+        try:
+            with open(self.path) as f:
+                self.profiles = json.load(f)
+        except (OSError, ValueError):
+            self.profiles = {}
+
+    def get(self, source):
+        return self.profiles.get(source, {})
+
+    def set(self, source, power_mode=None, fan1=None, fan2=None):
+        profile = {key: value for key, value in
+                   (("power_mode", power_mode), ("fan1", fan1), ("fan2", fan2)) if value is not None}
+        if profile:
+            self.profiles[source] = profile
+        else:
+            self.profiles.pop(source, None)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.profiles, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,53 @@
+import time
+
+# Host-side color writes the preview allows per second. Each is one SET_COLOR
+# report per color plus a status read, well within what the controller
+# takes, but slider drags fire far more often than the eye needs.
+PREVIEW_RATE = 30.0
+
+
+class ColorPreview:
+    """Coalesces live color previews into rate-limited writes.
+
+    update() records the latest colors, a list of (zones, (red, green, blue))
+    pairs. Only one write is in flight at a time and writes are at least
+    1/rate apart; values that arrive meanwhile replace each other, so once
+    the link is free only the newest one is sent.
+    """
+
+    def __init__(self, rate=PREVIEW_RATE):
+        self.interval = 1.0 / rate
+        self.pending = None
+        self.busy = False
+        self.dirty = False  # The keyboard shows a color that was not applied
+        self._last = None
+        self._sent_at = float("-inf")
+
+    def update(self, colors):
+        self.pending = None if colors == self._last else colors
+
+    def delay(self, now=None):
+        """Seconds until the pending colors may be sent; None if there is nothing to send."""
+        if self.pending is None or self.busy:
+            return None
+        if now is None:
+            now = time.monotonic()
+        return max(0.0, self._sent_at + self.interval - now)
+
+    def take(self, now=None):
+        """Return the colors to send now and mark the write in flight."""
+        colors, self.pending = self.pending, None
+        self._last = colors
+        self._sent_at = time.monotonic() if now is None else now
+        self.busy = True
+        self.dirty = True
+        return colors
+
+    def done(self):
+        self.busy = False
+
+    def reset(self):
+        """Drop pending colors, e.g. once the real animation has been written."""
+        self.pending = None
+        self._last = None
+        self.dirty = False
@@ -0,0 +1,145 @@
+"""Compiled lighting profiles.
+
+A profile is the exact sequence of 33-byte HID reports that programs each
+power animation, stored as a compact blob:
+
+    b"AWP1", then per animation: id and report count (2 bytes each, big
+    endian) followed by the reports
+
+Blobs are cached under the user's cache directory, keyed by a hash of the
+profile's inputs and of the code that builds it, so re-applying a profile
+is one file read and the report writes. The cache only saves work: when
+it cannot be read or written, profiles are compiled every time.
+"""
+import os
+import struct
+import hashlib
+import logging
+from elc import Elc, REPORT_LENGTH
+from paths import cache_dir
+
+log = logging.getLogger("dgsc.usb")
+
+MAGIC = b"AWP1"
+SEGMENT = struct.Struct('>HH')
+
+# Changes to these files change what a profile compiles to
+SOURCES = ("awelc.py", "elc.py", "elc_constants.py", "profiles.py")
+
+# Least recently used blobs beyond this are deleted
+MAX_PROFILES = 64
+
+
+class _Recorder:
+    # Stands in for the USB device; compiling only records reports.
+    idProduct = 0
+
+
+def compile_animations(animations):
+    """Record [(animation, build, args), ...] into [(animation, reports), ...].
+
+    build(elc, *args) is called on a recording Elc, so nothing is sent.
+    """
+    elc = Elc(0, 0, device=_Recorder())
+    segments = []
+    for animation, build, args in animations:
+        with elc.recording() as reports:
+            build(elc, *args)
+        segments.append((animation, reports))
+    return segments
+
+
+def pack(segments):
+    blob = bytearray(MAGIC)
+    for animation, reports in segments:
+        blob += SEGMENT.pack(animation, len(reports))
+        for report in reports:
+            blob += report
+    return bytes(blob)
+
+
+def unpack(blob):
+    """Split a blob into [(animation, reports), ...]; reports are views into it."""
+    if blob[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a compiled lighting profile")
+    view = memoryview(blob)
+    segments = []
+    offset = len(MAGIC)
+    while offset < len(blob):
+        animation, count = SEGMENT.unpack_from(blob, offset)
+        offset += SEGMENT.size
+        end = offset + count * REPORT_LENGTH
+        if end > len(blob):
+            raise ValueError("Truncated lighting profile")
+        segments.append((animation, [view[i:i + REPORT_LENGTH] for i in range(offset, end, REPORT_LENGTH)]))
+        offset = end
+    return segments
+
+
+def _code_stamp():
+    here = os.path.dirname(os.path.abspath(__file__))
+    stamp = []
+    for name in SOURCES:
+        try:
+            stamp.append(os.stat(os.path.join(here, name)).st_mtime_ns)
+        except OSError:
+            stamp.append(0)
+    return stamp
+
+
+def profile_key(kind, args):
+    return hashlib.sha256(repr((kind, tuple(args), _code_stamp())).encode()).hexdigest()[:32]
+
+
+class ProfileCache:
+    """Compiled profile blobs, one file per key, at most max_profiles of them."""
+
+    def __init__(self, directory=None, max_profiles=MAX_PROFILES):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def _path(self, key):
+        if self.directory is None:
+            self.directory = os.path.join(cache_dir(), "profiles")
+            os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, key + ".awp")
+
+    def load(self, key):
+        try:
+            path = self._path(key)
+            with open(path, "rb") as f:
+                segments = unpack(f.read())
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # Recently used, for _prune
+        except OSError:
+            pass
+        return segments
+
+    def store(self, key, segments):
+        try:
+            path = self._path(key)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(pack(segments))
+            os.replace(tmp, path)
+            self._prune()
+        except OSError as err:
+            log.warning("Cannot cache the lighting profile: %s", err)
+
+    def _prune(self):
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".awp")]
+        if len(paths) <= self.max_profiles:
+            return
+        used = {}
+        for path in paths:
+            try:
+                used[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass
+        for path in sorted(used, key=used.get)[:len(used) - self.max_profiles]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
@@ -0,0 +1,95 @@
+# Sensor: (min interval s, max interval s, change that counts as moving)
+SENSORS = {
+    "get_fan1_rpm": (1.0, 8.0, 100),
+    "get_cpu_temp": (1.0, 8.0, 1),
+    "get_fan2_rpm": (1.0, 8.0, 100),
+    "get_gpu_temp": (1.0, 8.0, 1),
+}
+
+# A sensor this close to its deadline (as a fraction of its interval) is read
+# along with one that is due, so that nearby reads share a wakeup.
+SLACK = 0.25
+
+
+class _Sensor:
+    def __init__(self, min_interval, max_interval, threshold):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.threshold = threshold
+        self.interval = min_interval
+        self.due = 0.0
+
+
+class TelemetryScheduler:
+    """Decides which sensors to read and when.
+
+    A sensor is read at its minimum interval while its value is moving and
+    backs off exponentially to its maximum interval while it is steady. Only
+    sensors some consumer subscribed to are read, and with no consumers
+    next_deadline() is None so the caller can stop its timer altogether.
+    Times are time.monotonic() seconds.
+    """
+
+    def __init__(self, sensors=None):
+        self._sensors = {}
+        self._consumers = {}
+        self.values = {}
+        for key, params in (sensors or SENSORS).items():
+            self.configure(key, *params)
+
+    def configure(self, key, min_interval, max_interval, threshold):
+        self._sensors[key] = _Sensor(min_interval, max_interval, threshold)
+
+    def subscribe(self, consumer, keys):
+        """Call consumer(values) whenever one of keys has been read."""
+        unknown = [key for key in keys if key not in self._sensors]
+        if unknown:
+            raise ValueError("Unknown sensor {}".format(", ".join(map(str, unknown))))
+        wanted = self.wanted()
+        self._consumers[consumer] = set(keys)
+        for key in set(keys) - wanted:
+            # Newly wanted sensors are read straight away at the fast rate
+            sensor = self._sensors[key]
+            sensor.interval = sensor.min_interval
+            sensor.due = 0.0
+
+    def unsubscribe(self, consumer):
+        self._consumers.pop(consumer, None)
+
+    def wanted(self):
+        keys = set()
+        for consumer_keys in self._consumers.values():
+            keys |= consumer_keys
+        return keys
+
+    def next_deadline(self):
+        deadlines = [self._sensors[key].due for key in self.wanted()]
+        return min(deadlines) if deadlines else None
+
+    def due(self, now):
+        keys = []
+        for key in self.wanted():
+            sensor = self._sensors[key]
+            if sensor.due - now <= SLACK * sensor.interval:
+                keys.append(key)
+        return sorted(keys)
+
+    def update(self, values, now):
+        for key, value in values.items():
+            sensor = self._sensors[key]
+            last = self.values.get(key)
+            if last is not None and abs(value - last) <= sensor.threshold:
+                sensor.interval = min(sensor.interval * 2, sensor.max_interval)
+            else:
+                sensor.interval = sensor.min_interval
+            sensor.due = now + sensor.interval
+            self.values[key] = value
+        for consumer, keys in list(self._consumers.items()):
+            if keys.intersection(values):
+                consumer(self.values)
+
+    def failed(self, keys, now):
+        # Retry failed reads at the slowest rate
+        for key in keys:
+            sensor = self._sensors[key]
+            sensor.due = now + sensor.max_interval
@@ -0,0 +1,43 @@
+"""The headless CLI paths stay within their import-time budgets.
+
+Runs the check of benchmarks/import_budget.py: each path is imported in a
+fresh interpreter under python -X importtime, best of several runs. A path
+whose dependencies are not installed (pyusb for the lighting path) is
+skipped.
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+from import_budget import BUDGETS, FORBIDDEN, RUNS, measure
+
+
+class ImportBudgetTest(unittest.TestCase):
+
+    def check(self, path):
+        modules, budget = BUDGETS[path]
+        try:
+            runs = [measure(modules) for _ in range(RUNS)]
+        except RuntimeError as err:
+            if "ModuleNotFoundError" in str(err):
+                self.skipTest(str(err))
+            raise
+        best = min(total for total, names in runs)
+        self.assertLessEqual(best, budget, "{} path imports in {:.1f} ms".format(path, best / 1000))
+        forbidden = sorted(name for name in runs[0][1] if name.split(".")[0] in FORBIDDEN)
+        self.assertEqual(forbidden, [], "{} path imports {}".format(path, ", ".join(forbidden)))
+
+    def test_led(self):
+        self.check("led")
+
+    def test_acpi(self):
+        self.check("acpi")
+
+    def test_hwmon(self):
+        self.check("hwmon")
+
+
+if __name__ == "__main__":
+    unittest.main()
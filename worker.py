@@ -0,0 +1,48 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from PySide6.QtCore import QObject, Signal
+
+log = logging.getLogger("dgsc.ui")
+
+
+class Worker(QObject):
+    """Runs blocking device work off the GUI thread.
+
+    Work is submitted to a named lane ("usb", "acpi", ...). Each lane has one
+    thread, so calls to the same device stay in order, while different
+    devices can be busy at the same time. Callbacks run on the GUI thread.
+    """
+
+    _done = Signal(object, object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._lanes = {}
+        self._done.connect(self._deliver)
+
+    def executor(self, lane):
+        if lane not in self._lanes:
+            self._lanes[lane] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=lane)
+        return self._lanes[lane]
+
+    def submit(self, lane, fn, *args, callback=None, errback=None):
+        """Run fn(*args) on lane; deliver the result or exception on the GUI thread."""
+        future = self.executor(lane).submit(fn, *args)
+        future.add_done_callback(lambda f: self._done.emit(f, callback, errback))
+        return future
+
+    def _deliver(self, future, callback, errback):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            if errback is None:
+                log.error("Background task failed", exc_info=error)
+            else:
+                errback(error)
+        elif callback is not None:
+            callback(future.result())
+
+    def shutdown(self):
+        for executor in self._lanes.values():
+            executor.shutdown(wait=True, cancel_futures=True)